@@ -29,42 +29,149 @@ American Fuzzy Lop fork server and instrumentation for pure-Python code
 
 __version__ = '0.7.4'
 
-cdef object os, signal, struct, sys, warnings
+cdef object ast, atexit, dis, fnmatch, gc, hashlib, json, marshal, os, re
+cdef object signal, struct, sys, threading, time, traceback, types, warnings
+import atexit
+import dis
+import fnmatch
+import gc
+import hashlib
+import json
+import marshal
 import os
+import re
 import signal
 import struct
 import sys
+import threading
+import time
+import traceback
+import types
 import warnings
 
+cdef object importlib_machinery, importlib_util
+try:
+    import importlib.machinery as importlib_machinery
+    import importlib.util as importlib_util
+except ImportError:
+    # Python << 3.4
+    importlib_machinery = importlib_util = None
+if sys.version_info >= (3, 6):
+    import ast
+else:
+    ast = None
+cdef object contextvars
+try:
+    # Python >= 3.7
+    import contextvars
+except ImportError:
+    contextvars = None
+
 cdef extern from *:
     # These constants must be kept in sync with afl-fuzz:
     '''
     #define SHM_ENV_VAR "__AFL_SHM_ID"
+    #define SHM_FUZZ_ENV_VAR "__AFL_SHM_FUZZ_ID"
     #define FORKSRV_FD 198
     #define MAP_SIZE_POW2 16
     #define MAP_SIZE (1 << MAP_SIZE_POW2)
+    #define FS_OPT_ENABLED 0x80000001U
+    #define FS_OPT_MAPSIZE 0x40000000U
+    #define FS_OPT_SHDMEM_FUZZ 0x01000000U
+    #define FS_OPT_MAX_MAPSIZE (1U << 23)
+    #define FS_OPT_SET_MAPSIZE(x) (((x) - 1) << 1)
     '''
     extern const char *SHM_ENV_VAR
+    extern const char *SHM_FUZZ_ENV_VAR
     extern int FORKSRV_FD
     extern int MAP_SIZE
+    extern unsigned int FS_OPT_ENABLED
+    extern unsigned int FS_OPT_MAPSIZE
+    extern unsigned int FS_OPT_SHDMEM_FUZZ
+    extern unsigned int FS_OPT_MAX_MAPSIZE
+    unsigned int FS_OPT_SET_MAPSIZE(unsigned int)
 
-from cpython.exc cimport PyErr_SetFromErrno
+cimport cython
+from cpython.exc cimport PyErr_CheckSignals, PyErr_SetFromErrno
+from cpython.ref cimport Py_INCREF, Py_XDECREF, PyObject
 from libc cimport errno
-from libc.signal cimport SIG_DFL
+from libc.signal cimport SIG_DFL, SIGCHLD, SIGCONT, SIGKILL, SIGSTOP
 from libc.stddef cimport size_t
-from libc.stdint cimport uint32_t
-from libc.stdlib cimport getenv
-from libc.string cimport strlen
-from posix.signal cimport sigaction, sigaction_t, sigemptyset
+from libc.stdint cimport uint16_t, uint32_t, uint64_t
+from libc.stdlib cimport calloc, free, getenv, realloc
+from libc.string cimport memcpy, memmove, memset, strlen
+from posix.fcntl cimport FD_CLOEXEC, F_GETFD, F_SETFD, F_SETFL, O_NONBLOCK, fcntl
+from posix.mman cimport MAP_ANONYMOUS, MAP_SHARED, PROT_READ, PROT_WRITE, mmap, munmap
+from posix.signal cimport kill, sigaction, sigaction_t, sigemptyset
+from posix.types cimport pid_t
+from posix.unistd cimport SEEK_SET, _exit, close, fork, lseek, pipe, read, write
+from posix.wait cimport WIFSIGNALED, WIFSTOPPED, WNOHANG, WUNTRACED, waitpid
+
+cdef extern from *:
+    '''
+    #if PY_MAJOR_VERSION >= 3
+    #define afl_memoryview(ptr, size) PyMemoryView_FromMemory((char *) (ptr), (size), PyBUF_READ)
+    #else
+    /* PyBuffer_FromMemory() would return a buffer object, not a memoryview */
+    static PyObject *afl_memoryview(void *ptr, Py_ssize_t size)
+    {
+        Py_buffer view;
+        if (PyBuffer_FillInfo(&view, NULL, ptr, size, 1, PyBUF_CONTIG_RO) < 0)
+            return NULL;
+        return PyMemoryView_FromBuffer(&view);
+    }
+    #endif
+    '''
+    object afl_memoryview(void *, Py_ssize_t)
+
+cdef extern from 'sys/mman.h':
+    # not in posix/mman.pxd of older Cython versions
+    void *MAP_FAILED
 
 cdef extern from 'sys/shm.h':
+    int shmget(int key, size_t size, int shmflg)
     unsigned char *shmat(int shmid, void *shmaddr, int shmflg)
+    int shmdt(const void *shmaddr)
+    struct shmid_ds:
+        size_t shm_segsz
+    int shmctl(int shmid, int cmd, shmid_ds *buf)
+    int IPC_CREAT
+    int IPC_EXCL
+    int IPC_PRIVATE
+    int IPC_RMID
+    int IPC_STAT
 
 cdef unsigned char *afl_area = NULL
-cdef unsigned int prev_location = 0
+cdef unsigned int map_size = MAP_SIZE
 
-cdef inline unsigned int lhash(const char *key, size_t offset):
-    # 32-bit Fowler–Noll–Vo hash function
+# shared memory test case (AFL++ only):
+# 32-bit length, followed by the data
+cdef unsigned char *afl_testcase_area = NULL
+cdef size_t afl_testcase_area_size = 0
+
+# The edge state is kept per thread.
+# On free-threaded Python, the map is updated atomically.
+
+cdef extern from *:
+    '''
+    #if defined(__STDC_VERSION__) && __STDC_VERSION__ >= 201112L && !defined(__STDC_NO_THREADS__)
+    #define AFL_THREAD_LOCAL _Thread_local
+    #else
+    #define AFL_THREAD_LOCAL __thread
+    #endif
+    static AFL_THREAD_LOCAL unsigned int afl_prev_location = 0;
+    #ifdef Py_GIL_DISABLED
+    #define afl_area_inc(area, i) ((void) __atomic_fetch_add(&(area)[i], 1, __ATOMIC_RELAXED))
+    #else
+    #define afl_area_inc(area, i) ((void) ((area)[i]++))
+    #endif
+    '''
+    unsigned int prev_location "afl_prev_location"
+    void afl_area_inc(unsigned char *area, size_t i)
+
+# 32-bit Fowler–Noll–Vo hash function:
+
+cdef inline uint32_t fnv_key(const char *key):
     cdef size_t len = strlen(key)
     cdef uint32_t h = 0x811C9DC5
     while len > 0:
@@ -72,33 +179,1445 @@ cdef inline unsigned int lhash(const char *key, size_t offset):
         h *= 0x01000193
         len -= 1
         key += 1
+    return h
+
+cdef inline uint32_t fnv_offset(uint32_t h, size_t offset):
     while offset > 0:
         h ^= <unsigned char> offset
         h *= 0x01000193
         offset >>= 8
     return h
 
+cdef inline uint32_t fnv_word(uint32_t h, uint32_t word):
+    cdef int i
+    for i in range(4):
+        h ^= <unsigned char> word
+        h *= 0x01000193
+        word >>= 8
+    return h
+
+cdef inline unsigned int lhash(const char *key, size_t offset):
+    return fnv_offset(fnv_key(key), offset)
+
 def _hash(key, offset):
     # This function is not a part of public API.
     # It is provided only to facilitate testing.
     return lhash(key, offset)
 
+# Filters for instrumented modules:
+
+@cython.internal
+cdef class Filter:
+    # Patterns that contain a slash or a wildcard are path globs,
+    # which are matched against the full filename.
+    # Other patterns are module names, which match also submodules.
+
+    cdef bint active
+    cdef frozenset modules
+    cdef object regex
+
+    def __cinit__(self, patterns):
+        modules = set()
+        globs = []
+        for pattern in patterns:
+            if re.search('[/*?[]', pattern):
+                globs += [fnmatch.translate(pattern)]
+            else:
+                modules.add(pattern)
+        self.modules = frozenset(modules)
+        if globs:
+            self.regex = re.compile(str.join('|', globs))
+        self.active = bool(modules or globs)
+
+    cdef bint match(self, filename, module) except -1:
+        if self.regex is not None and self.regex.match(filename):
+            return True
+        while module:
+            if module in self.modules:
+                return True
+            module = module.rpartition('.')[0]
+        return False
+
+cdef Filter include_filter = Filter(())
+cdef Filter exclude_filter = Filter(())
+
+cdef object parse_filter(patterns, env_var):
+    if patterns is None:
+        patterns = os.getenv(env_var) or ''
+    if isinstance(patterns, str):
+        patterns = patterns.replace(',', ' ').split()
+    return list(patterns)
+
+cdef dict module_names = {}
+cdef Py_ssize_t module_names_n = -1
+
+cdef object get_module_name(filename):
+    global module_names_n
+    name = module_names.get(filename)
+    if name is None and len(sys.modules) != module_names_n:
+        module_names_n = len(sys.modules)
+        for (modname, module) in list(sys.modules.items()):
+            path = getattr(module, '__file__', None)
+            if not path:
+                continue
+            if path.endswith(('.pyc', '.pyo')):
+                path = path[:-1]
+            module_names[path] = modname
+        name = module_names.get(filename)
+    return name
+
+cdef bint is_excluded(filename) except -1:
+    if not (include_filter.active or exclude_filter.active):
+        return False
+    module = get_module_name(filename)
+    if include_filter.active and not include_filter.match(filename, module):
+        return True
+    return exclude_filter.active and exclude_filter.match(filename, module)
+
+# Location ID table:
+# Instead of hashing, lines can be given dense sequential IDs,
+# which don't collide with each other until the map is full.
+# Files are identified by their paths relative to the sys.path entry
+# that contains them, so that the IDs don't depend on where the code lives.
+# The table is a text file with one "path<TAB>line" entry per line;
+# the ID of a location is the number of its entry (counting from 0).
+# New entries are appended with the file locked,
+# so that the table can be shared between processes.
+
+cdef extern from 'sys/file.h':
+    enum:
+        LOCK_EX
+        LOCK_UN
+    int flock(int fd, int operation)
+
+@cython.internal
+cdef class IdTable:
+
+    cdef object path
+    cdef int fd
+    cdef dict ids
+    cdef dict paths
+    cdef Py_ssize_t n_entries
+    cdef Py_ssize_t size
+    cdef object mutex
+    cdef int lock_depth
+
+    def __cinit__(self, path):
+        self.fd = -1
+        self.path = path
+        self.ids = {}
+        self.paths = {}
+        self.mutex = threading.RLock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o666)
+        self.load()
+
+    def __dealloc__(self):
+        if self.fd >= 0:
+            close(self.fd)
+
+    cdef object relative_path(self, filename):
+        # Return path of the file relative to the sys.path entry
+        # that contains it, or None if there's no such entry.
+        # Pseudo-filenames are returned as is.
+        try:
+            return self.paths[filename]
+        except KeyError:
+            pass
+        relpath = None
+        if filename.startswith('<'):
+            # pseudo-filename, such as "<frozen codecs>" or "<string>"
+            relpath = filename
+        else:
+            path = os.path.abspath(filename)
+            root = ''
+            for entry in sys.path:
+                entry = os.path.join(os.path.abspath(entry), '')
+                if len(entry) > len(root) and path.startswith(entry):
+                    root = entry
+            if root:
+                relpath = path[len(root):].replace(os.sep, '/')
+        if relpath is not None and ('\t' in relpath or '\n' in relpath):
+            relpath = None
+        self.paths[filename] = relpath
+        return relpath
+
+    cdef int load(self) except -1:
+        # read entries appended since the last time
+        size = os.fstat(self.fd).st_size
+        if size <= self.size:
+            return 0
+        os.lseek(self.fd, self.size, os.SEEK_SET)
+        data = b''
+        while len(data) < size - self.size:
+            chunk = os.read(self.fd, size - self.size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        # the last entry might be still being written
+        end = data.rfind(b'\n') + 1
+        for entry in data[:end].splitlines():
+            (path, _, line) = entry.partition(b'\t')
+            if sys.version_info >= (3,):
+                path = path.decode('UTF-8', 'surrogateescape')
+            try:
+                self.ids.setdefault((path, int(line)), self.n_entries)
+            except ValueError:
+                pass
+            self.n_entries += 1
+        self.size += end
+        return 0
+
+    cdef int lock(self) except -1:
+        self.mutex.acquire()
+        if self.lock_depth == 0 and flock(self.fd, LOCK_EX) != 0:
+            self.mutex.release()
+            PyErr_SetFromErrno(OSError)
+        self.lock_depth += 1
+        return 0
+
+    cdef int unlock(self) except -1:
+        self.lock_depth -= 1
+        if self.lock_depth == 0:
+            flock(self.fd, LOCK_UN)
+        self.mutex.release()
+        return 0
+
+    cdef object get(self, relpath, size_t line):
+        # Return ID of the location, allocating a new one if needed,
+        # or None if the table can't be updated.
+        cdef bytes entry
+        key = (relpath, line)
+        location_id = self.ids.get(key)
+        if location_id is not None:
+            return location_id
+        try:
+            self.lock()
+        except OSError:
+            return None
+        try:
+            self.load()
+            location_id = self.ids.get(key)
+            if location_id is not None:
+                return location_id
+            if self.size < os.fstat(self.fd).st_size:
+                # a partial entry, left by a process that died while writing it
+                write_all(self.fd, <const char *> b'\n', 1)
+            if sys.version_info >= (3,):
+                relpath = relpath.encode('UTF-8', 'surrogateescape')
+            entry = relpath + ('\t{0}\n'.format(line)).encode('ASCII')
+            write_all(self.fd, <const char *> entry, len(entry))
+            self.load()
+            return self.ids.get(key)
+        except OSError:
+            return None
+        finally:
+            self.unlock()
+
+cdef IdTable id_table = None
+
+cdef inline unsigned int spread_id(uint64_t id):
+    # Map the ID to a map slot.
+    # IDs below the map size get distinct slots,
+    # but they are scattered over the whole map,
+    # because edges are made by XORing IDs of pairs of locations,
+    # and small IDs would make lots of edges share slots.
+    # (Multiplication by a prime larger than any map size is a permutation.)
+    if stats_area != NULL:
+        stats_add_location(<uint32_t> id)
+    return id % map_size * 2654435761U % map_size
+
+cdef int configure_id_table() except -1:
+    global id_table
+    path = os.getenv('PYTHON_AFL_ID_TABLE') or None
+    if path is None:
+        if id_table is not None:
+            id_table = None
+            code_cache.clear()
+    elif id_table is None or id_table.path != path:
+        id_table = IdTable(path)
+        code_cache.clear()
+    return 0
+
+# Per-code-object cache of location IDs:
+
+cdef frozenset jump_opcodes = frozenset(
+    dis.hasjrel + dis.hasjabs + getattr(dis, 'hasjump', [])
+)
+
+cdef extern from *:
+    '''
+    #define NO_LOCATION 0xFFFFFFFFU
+    '''
+    extern unsigned int NO_LOCATION
+
+# Statistics mode ($PYTHON_AFL_STATS):
+# the children account trace events, and the time spent handling them,
+# to per-code-object records in a shared memory side area.
+# The area also remembers which location hashes fell into each map slot
+# (to estimate collisions), and the union of the maps of all runs.
+# The fork server dumps it all when it exits.
+
+cdef extern from *:
+    '''
+    #include <time.h>
+    #define AFL_STATS_CODE_SLOTS 4096
+    #define AFL_STATS_LOCATION_WAYS 4
+    typedef struct {
+        uint64_t key;
+        uint64_t events;
+        uint64_t time_ns;
+        uint32_t first_line;
+        char qualname[64];
+        char filename[164];
+    } afl_stats_code;
+    typedef struct {
+        uint64_t execs;
+        afl_stats_code code[AFL_STATS_CODE_SLOTS];
+    } afl_stats_header;
+    static uint64_t afl_stats_now(void)
+    {
+        struct timespec ts;
+        clock_gettime(CLOCK_MONOTONIC, &ts);
+        return (uint64_t) ts.tv_sec * 1000000000U + ts.tv_nsec;
+    }
+    static void afl_stats_count(afl_stats_code *code, uint64_t start)
+    {
+        uint64_t now = afl_stats_now();
+        __atomic_fetch_add(&code->events, 1, __ATOMIC_RELAXED);
+        __atomic_fetch_add(&code->time_ns, now - start, __ATOMIC_RELAXED);
+    }
+    static afl_stats_code *afl_stats_claim(afl_stats_header *stats, uint64_t key, int *is_new)
+    {
+        /* open addressing; slot 0 collects everything that doesn't fit */
+        size_t n = AFL_STATS_CODE_SLOTS - 1;
+        size_t i = key % n;
+        size_t j;
+        *is_new = 0;
+        for (j = 0; j < n; j++) {
+            afl_stats_code *code = &stats->code[1 + (i + j) % n];
+            uint64_t expected = 0;
+            if (__atomic_compare_exchange_n(&code->key, &expected, key, 0, __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE)) {
+                *is_new = 1;
+                return code;
+            }
+            if (expected == key)
+                return code;
+        }
+        return &stats->code[0];
+    }
+    static void afl_stats_add_location(uint32_t *ways, uint32_t h)
+    {
+        int j;
+        if (h == 0)
+            h = 1;
+        for (j = 0; j < AFL_STATS_LOCATION_WAYS; j++) {
+            uint32_t expected = 0;
+            if (__atomic_compare_exchange_n(&ways[j], &expected, h, 0, __ATOMIC_RELAXED, __ATOMIC_RELAXED))
+                return;
+            if (expected == h)
+                return;
+        }
+    }
+    '''
+    enum:
+        STATS_CODE_SLOTS "AFL_STATS_CODE_SLOTS"
+        STATS_LOCATION_WAYS "AFL_STATS_LOCATION_WAYS"
+    ctypedef struct stats_code "afl_stats_code":
+        uint64_t key
+        uint64_t events
+        uint64_t time_ns
+        uint32_t first_line
+        char qualname[64]
+        char filename[164]
+    ctypedef struct stats_header "afl_stats_header":
+        uint64_t execs
+        stats_code code[1]
+    uint64_t stats_now "afl_stats_now"() nogil
+    void stats_count "afl_stats_count"(stats_code *, uint64_t) nogil
+    stats_code *stats_claim "afl_stats_claim"(stats_header *, uint64_t, int *) nogil
+    void stats_add_location_ways "afl_stats_add_location"(uint32_t *, uint32_t) nogil
+
+cdef stats_header *stats_area = NULL
+cdef size_t stats_area_size = 0
+cdef uint32_t *stats_locations = NULL
+cdef unsigned char *stats_map = NULL
+cdef object stats_path = None
+
+cdef inline void stats_add_location(uint32_t h):
+    stats_add_location_ways(stats_locations + (h % map_size) * STATS_LOCATION_WAYS, h)
+
+cdef int copy_name(char *buffer, size_t size, name) except -1:
+    # copy the tail of the name, NUL-terminated
+    if not isinstance(name, bytes):
+        name = name.encode('UTF-8', 'surrogateescape' if sys.version_info >= (3,) else 'replace')
+    cdef bytes data = name[-(size - 1):]
+    memcpy(buffer, <const char *> data, len(data))
+    buffer[len(data)] = 0
+    return 0
+
+# ids of code objects that had frames running when tracing started:
+cdef set untraced_codes = set()
+
+@cython.internal
+cdef class CodeInfo:
+
+    cdef object code
+    cdef object filename
+    cdef object relpath
+    cdef bint excluded
+    cdef uint32_t filename_hash
+    cdef int first_line
+    cdef int n_lines
+    cdef unsigned int *locations
+    cdef Py_ssize_t code_size
+    cdef unsigned char *jumps
+    cdef int *lines
+    cdef bint coroutine
+    cdef bint maybe_untraced
+    cdef stats_code *stats
+
+    def __cinit__(self, code):
+        self.code = code
+        self.filename = code.co_filename
+        self.excluded = is_excluded(self.filename)
+        self.filename_hash = fnv_key(self.filename)
+        if id_table is not None and not self.excluded:
+            self.relpath = id_table.relative_path(self.filename)
+            if self.relpath is not None:
+                # hashed IDs (of branches) shouldn't depend on where the code lives either
+                self.filename_hash = fnv_key(self.relpath)
+        self.first_line = code.co_firstlineno
+        self.coroutine = edge_state is not None and code.co_flags & CO_ANY_COROUTINE
+        self.maybe_untraced = id(code) in untraced_codes
+        last_line = self.first_line
+        for offset, line in dis.findlinestarts(code):
+            if line is not None and line > last_line:
+                last_line = line
+        self.n_lines = last_line - self.first_line + 1
+        self.locations = <unsigned int *> calloc(self.n_lines, sizeof(unsigned int))
+        if self.locations == NULL:
+            raise MemoryError
+        memset(self.locations, 0xFF, self.n_lines * sizeof(unsigned int))
+
+    def __dealloc__(self):
+        free(self.locations)
+        free(self.jumps)
+        free(self.lines)
+
+    cdef inline unsigned int location(self, size_t line):
+        cdef size_t i = line - self.first_line
+        cdef unsigned int location
+        if i >= <size_t> self.n_lines:
+            return self.new_location(line)
+        location = self.locations[i]
+        if location == NO_LOCATION:
+            location = self.locations[i] = self.new_location(line)
+        return location
+
+    cdef inline unsigned int new_location(self, size_t line):
+        cdef uint32_t h
+        location_id = None
+        if self.relpath is not None:
+            location_id = id_table.get(self.relpath, line)
+        if location_id is not None:
+            return spread_id(location_id)
+        h = fnv_offset(self.filename_hash, line)
+        if stats_area != NULL:
+            stats_add_location(h)
+        return h % map_size
+
+    cdef int claim_stats(self) except -1:
+        cdef int is_new
+        qualname = getattr(self.code, 'co_qualname', self.code.co_name)
+        cdef uint64_t key = (
+            <uint64_t> self.filename_hash << 32 |
+            fnv_word(fnv_key(qualname), <uint32_t> self.first_line)
+        )
+        self.stats = stats_claim(stats_area, key | 1, &is_new)
+        if is_new:
+            self.stats.first_line = self.first_line
+            copy_name(self.stats.qualname, sizeof(self.stats.qualname), qualname)
+            copy_name(self.stats.filename, sizeof(self.stats.filename), self.filename)
+        return 0
+
+    cdef int init_jumps(self) except -1:
+        # bitmap of jump instruction offsets, for branch coverage
+        cdef unsigned char *jumps
+        code_size = len(self.code.co_code)
+        jumps = <unsigned char *> calloc(code_size, 1)
+        if jumps == NULL:
+            raise MemoryError
+        for instruction in dis.get_instructions(self.code):
+            if instruction.opcode in jump_opcodes:
+                jumps[instruction.offset] = 1
+        self.code_size = code_size
+        self.jumps = jumps
+        return 0
+
+    cdef inline bint is_jump(self, size_t offset):
+        return offset < <size_t> self.code_size and self.jumps[offset]
+
+    cdef int init_lines(self) except -1:
+        # line numbers of instructions (0 if none), for the monitoring backend
+        cdef int *lines
+        code_size = len(self.code.co_code)
+        lines = <int *> calloc(code_size // 2 + 1, sizeof(int))
+        if lines == NULL:
+            raise MemoryError
+        for (start, end, line) in self.code.co_lines():
+            if line is not None:
+                for i in range(start // 2, min(end, code_size) // 2):
+                    lines[i] = line
+        self.code_size = code_size
+        self.lines = lines
+        return 0
+
+    cdef inline int line_at(self, size_t offset) except -1:
+        if self.lines == NULL:
+            self.init_lines()
+        if offset >= <size_t> self.code_size:
+            return 0
+        return self.lines[offset // 2]
+
+    cdef int fill(self) except -1:
+        for offset, line in dis.findlinestarts(self.code):
+            if line is not None:
+                self.location(line)
+        if branch_mode and self.jumps == NULL:
+            self.init_jumps()
+        if stats_area != NULL and self.stats == NULL:
+            self.claim_stats()
+        return 0
+
+cdef dict code_cache = {}
+cdef Py_ssize_t code_cache_size = 65536
+
+cdef CodeInfo get_code_info(object code):
+    # The cache is keyed by id(), because code objects with equal contents
+    # can come from different files.
+    # CodeInfo holds a reference to the code object,
+    # so that the id is not recycled while it's in the cache.
+    key = id(code)
+    cdef CodeInfo info = code_cache.get(key)
+    if info is None:
+        if len(code_cache) >= code_cache_size:
+            # evict the oldest entry
+            del code_cache[next(iter(code_cache))]
+        info = CodeInfo(code)
+        code_cache[key] = info
+    return info
+
+cdef inline uint64_t stats_start():
+    # return the time when handling of a trace event started,
+    # or 0 if the statistics mode is off
+    if stats_area == NULL:
+        return 0
+    return stats_now()
+
+cdef inline int stats_stop(CodeInfo info, uint64_t start) except -1:
+    if stats_area == NULL:
+        return 0
+    if info.stats == NULL:
+        info.claim_stats()
+    stats_count(info.stats, start)
+    return 0
+
+cdef int prewarm_code_cache() except -1:
+    # Fill the cache with code of all functions that exist right now,
+    # so that the forked children inherit it.
+    todo = [
+        obj.__code__ for obj in gc.get_objects()
+        if isinstance(obj, types.FunctionType)
+    ]
+    seen = set()
+    if id_table is not None:
+        # allocate all the new IDs in one go
+        id_table.lock()
+    try:
+        while todo and len(code_cache) < code_cache_size:
+            code = todo.pop()
+            if id(code) in seen:
+                continue
+            seen.add(id(code))
+            get_code_info(code).fill()
+            todo += [
+                const for const in code.co_consts
+                if isinstance(const, types.CodeType)
+            ]
+    finally:
+        if id_table is not None:
+            id_table.unlock()
+    return 0
+
+cdef object coverage_mode = 'line'
+cdef bint branch_mode = False
+
+# Variants of line coverage:
+# in the context-sensitive mode, edges are combined with a hash of the call stack;
+# in the N-gram mode, with the N-1 locations that preceded the current one.
+cdef bint context_mode = False
+cdef int ngram_size = 0
+
+# asyncio support:
+# with line coverage, the edge state of coroutines is kept per task
+# (or rather, per context), and restored whenever a coroutine is resumed.
+# Whatever was running before is restored when the coroutine is suspended.
+
+cdef enum:
+    CO_ANY_COROUTINE = 0x80 | 0x100 | 0x200  # CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR
+
+cdef object edge_state = None
+if contextvars is not None:
+    edge_state = contextvars.ContextVar('afl_edge_state', default=0)
+
+cdef extern from *:
+    '''
+    #define AFL_MAX_RESUME_DEPTH 1024
+    static AFL_THREAD_LOCAL unsigned int afl_resume_stack[AFL_MAX_RESUME_DEPTH];
+    static AFL_THREAD_LOCAL int afl_resume_depth = 0;
+    '''
+    enum:
+        MAX_RESUME_DEPTH "AFL_MAX_RESUME_DEPTH"
+    unsigned int resume_stack "afl_resume_stack" [MAX_RESUME_DEPTH]
+    int resume_depth "afl_resume_depth"
+
+cdef inline int resume_coroutine() except -1:
+    global prev_location, resume_depth
+    if resume_depth < MAX_RESUME_DEPTH:
+        resume_stack[resume_depth] = prev_location
+    resume_depth += 1
+    prev_location = edge_state.get()
+    return 0
+
+cdef inline int suspend_coroutine() except -1:
+    global prev_location, resume_depth
+    if resume_depth == 0:
+        # tracing started inside the coroutine
+        return 0
+    edge_state.set(prev_location)
+    resume_depth -= 1
+    if resume_depth < MAX_RESUME_DEPTH:
+        prev_location = resume_stack[resume_depth]
+    return 0
+
+cdef extern from *:
+    '''
+    #define AFL_MAX_CALL_DEPTH 1024
+    #define AFL_MAX_NGRAM 16
+    static AFL_THREAD_LOCAL unsigned int afl_call_context = 0;
+    static AFL_THREAD_LOCAL unsigned int afl_context_stack[AFL_MAX_CALL_DEPTH];
+    static AFL_THREAD_LOCAL int afl_call_depth = 0;
+    static AFL_THREAD_LOCAL unsigned int afl_ngram_history[AFL_MAX_NGRAM];
+    static AFL_THREAD_LOCAL unsigned int afl_ngram_pos = 0;
+    '''
+    enum:
+        MAX_CALL_DEPTH "AFL_MAX_CALL_DEPTH"
+        MAX_NGRAM "AFL_MAX_NGRAM"
+    unsigned int call_context "afl_call_context"
+    unsigned int context_stack "afl_context_stack" [MAX_CALL_DEPTH]
+    int call_depth "afl_call_depth"
+    unsigned int ngram_history "afl_ngram_history" [MAX_NGRAM]
+    unsigned int ngram_pos "afl_ngram_pos"
+
+cdef inline void enter_context():
+    global call_context, call_depth
+    if call_depth < MAX_CALL_DEPTH:
+        context_stack[call_depth] = call_context
+    call_depth += 1
+    # The call site is identified by the last line executed by the caller.
+    # Hashing (rather than XORing) makes recursion levels distinct.
+    call_context = fnv_word(call_context, prev_location) % map_size
+
+cdef inline void leave_context():
+    global call_context, call_depth
+    if call_depth == 0:
+        # tracing started inside the function
+        return
+    call_depth -= 1
+    if call_depth < MAX_CALL_DEPTH:
+        call_context = context_stack[call_depth]
+
+cdef inline unsigned int ngram_offset(unsigned int location):
+    # Combine the locations that came before prev_location,
+    # each shifted by its distance from the current location,
+    # the same way as prev_location is shifted by 1.
+    global ngram_pos
+    cdef unsigned int offset = 0
+    cdef int i
+    for i in range(2, ngram_size):
+        offset ^= ngram_history[(ngram_pos - i + 1) & (MAX_NGRAM - 1)] >> i
+    ngram_pos += 1
+    ngram_history[ngram_pos & (MAX_NGRAM - 1)] = location
+    return offset
+
+cdef void reset_edge_state():
+    # forget the previous location and the calling context
+    global call_context, call_depth, last_location, ngram_pos, prev_location
+    prev_location = 0
+    last_location = 0
+    call_context = 0
+    call_depth = 0
+    ngram_pos = 0
+    memset(ngram_history, 0, sizeof(ngram_history))
+
+cdef inline int enter_line_frame(CodeInfo info) except -1:
+    # function call or resumption of a generator or coroutine
+    if context_mode:
+        enter_context()
+    if info.coroutine:
+        resume_coroutine()
+    return 0
+
+cdef inline int leave_line_frame(CodeInfo info) except -1:
+    # return, yield, or exception propagating out of the frame
+    if info.coroutine:
+        suspend_coroutine()
+    if context_mode:
+        leave_context()
+    return 0
+
+cdef extern from *:
+    '''
+    static AFL_THREAD_LOCAL unsigned int afl_last_location = 0;
+    '''
+    unsigned int last_location "afl_last_location"
+
+cdef inline void record_location(unsigned int location):
+    global last_location, prev_location
+    cdef unsigned int offset
+    offset = location ^ prev_location ^ call_context
+    if ngram_size > 0:
+        offset ^= ngram_offset(location)
+    prev_location = location // 2
+    last_location = location
+    afl_area_inc(afl_area, offset)
+
+cdef inline void record_line(CodeInfo info, size_t line):
+    record_location(info.location(line))
+
+# Branch coverage:
+
+cdef enum:
+    EDGE_JUMP = 0
+    EDGE_HANDLER = 1
+    EDGE_RAISE = 2
+    EDGE_ENTRY = 3
+
+cdef inline void record_edge(CodeInfo info, size_t src, size_t dst, int kind):
+    # src and dst are bytecode offsets
+    cdef uint32_t h = fnv_word(
+        fnv_word(info.filename_hash, <uint32_t> src),
+        <uint32_t> (dst << 2 | kind)
+    )
+    if stats_area != NULL:
+        stats_add_location(h)
+    afl_area_inc(afl_area, h % map_size)
+
+# The trace function backends see individual opcodes,
+# so they need to remember, for each active frame,
+# the offset of the last jump or exception:
+
+cdef extern from *:
+    '''
+    #define AFL_MAX_FRAME_DEPTH 1024
+    static AFL_THREAD_LOCAL long afl_frame_jumps[AFL_MAX_FRAME_DEPTH];
+    static AFL_THREAD_LOCAL int afl_frame_depth = 0;
+    '''
+    enum:
+        MAX_FRAME_DEPTH "AFL_MAX_FRAME_DEPTH"
+    long frame_jumps "afl_frame_jumps" [MAX_FRAME_DEPTH]
+    int frame_depth "afl_frame_depth"
+
+cdef enum:
+    NO_JUMP = -1
+
+cdef inline void enter_frame(CodeInfo info):
+    global frame_depth
+    if frame_depth < MAX_FRAME_DEPTH:
+        frame_jumps[frame_depth] = NO_JUMP
+    frame_depth += 1
+    record_edge(info, 0, 0, EDGE_ENTRY)
+
+cdef inline void leave_frame():
+    global frame_depth
+    if frame_depth > 0:
+        frame_depth -= 1
+
+cdef inline int record_opcode(CodeInfo info, size_t offset) except -1:
+    cdef int i = frame_depth - 1
+    cdef long jump
+    if i < 0 or i >= MAX_FRAME_DEPTH:
+        return 0
+    if info.jumps == NULL:
+        info.init_jumps()
+    jump = frame_jumps[i]
+    if jump != NO_JUMP:
+        record_edge(info, jump >> 1, offset, EDGE_HANDLER if jump & 1 else EDGE_JUMP)
+    frame_jumps[i] = <long> (offset << 1) if info.is_jump(offset) else NO_JUMP
+    return 0
+
+cdef inline void record_exception(CodeInfo info, size_t offset):
+    cdef int i = frame_depth - 1
+    record_edge(info, offset, 0, EDGE_RAISE)
+    if 0 <= i < MAX_FRAME_DEPTH:
+        frame_jumps[i] = <long> (offset << 1 | 1)
+
+cdef int enable_opcode_events(frame) except -1:
+    frame.f_trace_lines = False
+    # Since Python 3.13, f_trace_opcodes takes effect only if f_trace is set.
+    frame.f_trace = trace
+    frame.f_trace_opcodes = True
+    return 0
+
 cdef object trace
 def trace(frame, event, arg):
-    global prev_location, tstl_mode
-    cdef unsigned int location, offset
-    cdef object filename = frame.f_code.co_filename
-    if tstl_mode and (filename[-7:] in ['sut.py', '/sut.py']):
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(frame.f_code)
+    if info.excluded:
+        stats_stop(info, start)
+        # This stops line events for the frame, too.
         return None
-    location = (
-        lhash(filename, frame.f_lineno)
-        % MAP_SIZE
-    )
+    if not branch_mode:
+        if event == 'call':
+            enter_line_frame(info)
+        record_line(info, frame.f_lineno)
+        if event == 'return':
+            leave_line_frame(info)
+    elif event == 'opcode':
+        record_opcode(info, frame.f_lasti)
+    elif event == 'call':
+        enable_opcode_events(frame)
+        enter_frame(info)
+    elif event == 'return':
+        leave_frame()
+    elif event == 'exception':
+        record_exception(info, frame.f_lasti)
+    stats_stop(info, start)
+    return trace
+
+# Like sys.settrace(), the other backends shouldn't see the frames
+# that were already running when tracing started
+# (such as the one that called afl.init()),
+# at least until they return or yield.
+
+cdef extern from *:
+    '''
+    #define AFL_MAX_UNTRACED_FRAMES 64
+    static AFL_THREAD_LOCAL PyObject *afl_untraced_frames[AFL_MAX_UNTRACED_FRAMES];
+    static AFL_THREAD_LOCAL int afl_n_untraced_frames = 0;
+    '''
+    enum:
+        MAX_UNTRACED_FRAMES "AFL_MAX_UNTRACED_FRAMES"
+    PyObject *untraced_frames "afl_untraced_frames" [MAX_UNTRACED_FRAMES]
+    int n_untraced_frames "afl_n_untraced_frames"
+
+cdef int add_untraced_frames(frame) except -1:
+    # frame and its callers;
+    # the outermost ones might not fit, but then they are traced as usual
+    global n_untraced_frames
+    cdef CodeInfo info
+    while frame is not None and n_untraced_frames < MAX_UNTRACED_FRAMES:
+        Py_INCREF(frame)
+        untraced_frames[n_untraced_frames] = <PyObject *> frame
+        n_untraced_frames += 1
+        key = id(frame.f_code)
+        untraced_codes.add(key)
+        info = code_cache.get(key)
+        if info is not None:
+            info.maybe_untraced = True
+        frame = frame.f_back
+    return 0
+
+cdef bint is_untraced(PyObject *frame, bint leaving):
+    # Once the frame returns or yields, it's forgotten:
+    # it's traced as any other when it's resumed.
+    global n_untraced_frames
+    cdef int i
+    for i in range(n_untraced_frames):
+        if untraced_frames[i] == frame:
+            if leaving:
+                n_untraced_frames -= 1
+                untraced_frames[i] = untraced_frames[n_untraced_frames]
+                Py_XDECREF(frame)
+            return True
+    return False
+
+cdef void clear_untraced_frames():
+    global n_untraced_frames
+    while n_untraced_frames > 0:
+        n_untraced_frames -= 1
+        Py_XDECREF(untraced_frames[n_untraced_frames])
+
+# C-level trace function, installed with PyEval_SetTrace():
+
+cdef extern from *:
+    '''
+    #include <frameobject.h>
+    #if PY_VERSION_HEX < 0x030900B1
+    static PyObject *afl_frame_code(PyFrameObject *frame)
+    {
+        Py_INCREF(frame->f_code);
+        return (PyObject *) frame->f_code;
+    }
+    #else
+    #define afl_frame_code(frame) ((PyObject *) PyFrame_GetCode(frame))
+    #endif
+    #if PY_VERSION_HEX >= 0x030B0000
+    #define afl_frame_lasti(frame) PyFrame_GetLasti(frame)
+    #elif PY_VERSION_HEX >= 0x030A0000
+    #define afl_frame_lasti(frame) ((frame)->f_lasti * 2)
+    #else
+    #define afl_frame_lasti(frame) ((frame)->f_lasti)
+    #endif
+    #if PY_VERSION_HEX < 0x030A0000
+    /* The interpreter keeps f_lineno up to date while tracing,
+       but PyFrame_GetLineNumber() returns it only if f_trace is set
+       (as it is with sys.settrace()); otherwise, it recomputes the line
+       from f_lasti, which doesn't always agree. */
+    #define afl_frame_lineno(frame) ((frame)->f_lineno)
+    #else
+    #define afl_frame_lineno(frame) PyFrame_GetLineNumber(frame)
+    #endif
+    #ifndef PyTrace_OPCODE
+    #define PyTrace_OPCODE 7
+    #endif
+    '''
+    ctypedef struct PyFrameObject:
+        pass
+    ctypedef int (*Py_tracefunc)(PyObject *, PyFrameObject *, int, PyObject *) except -1
+    enum:
+        PyTrace_CALL
+        PyTrace_EXCEPTION
+        PyTrace_LINE
+        PyTrace_RETURN
+        PyTrace_OPCODE
+    void PyEval_SetTrace(Py_tracefunc, PyObject *)
+    PyFrameObject *PyEval_GetFrame()
+    object afl_frame_code(PyFrameObject *)
+    int afl_frame_lasti(PyFrameObject *)
+    int afl_frame_lineno(PyFrameObject *)
+
+# f_trace_lines and f_trace_opcodes are new in Python 3.7:
+cdef bint has_f_trace_flags = sys.version_info >= (3, 7)
+
+cdef int ctrace(PyObject *obj, PyFrameObject *frame, int what, PyObject *arg) except -1:
+    cdef CodeInfo info
+    cdef uint64_t start
+    if what != PyTrace_CALL and what != PyTrace_LINE and what != PyTrace_RETURN and what != PyTrace_EXCEPTION:
+        if what != PyTrace_OPCODE:
+            return 0
+    start = stats_start()
+    info = get_code_info(afl_frame_code(frame))
+    if info.maybe_untraced and is_untraced(<PyObject *> frame, what == PyTrace_RETURN):
+        stats_stop(info, start)
+        return 0
+    if info.excluded:
+        if what == PyTrace_CALL and has_f_trace_flags:
+            # stop line events for the frame
+            (<object> frame).f_trace_lines = False
+        stats_stop(info, start)
+        return 0
+    if not branch_mode:
+        if what == PyTrace_CALL:
+            enter_line_frame(info)
+        record_line(info, afl_frame_lineno(frame))
+        if what == PyTrace_RETURN:
+            leave_line_frame(info)
+    elif what == PyTrace_OPCODE:
+        record_opcode(info, afl_frame_lasti(frame))
+    elif what == PyTrace_CALL:
+        enable_opcode_events(<object> frame)
+        enter_frame(info)
+    elif what == PyTrace_RETURN:
+        leave_frame()
+    elif what == PyTrace_EXCEPTION:
+        record_exception(info, afl_frame_lasti(frame))
+    stats_stop(info, start)
+    return 0
+
+# sys.monitoring (PEP 669) backend; Python >= 3.12 only:
+cdef object monitoring = getattr(sys, 'monitoring', None)
+cdef object monitoring_disable = None
+cdef int monitoring_tool = -1
+cdef dict monitoring_callbacks = {}
+
+# With line coverage, the callbacks reproduce the events of sys.settrace():
+# PY_START, PY_RESUME and PY_THROW are "call" events;
+# PY_RETURN, PY_YIELD and PY_UNWIND are "return" events;
+# RAISE and STOP_ITERATION are "exception" events.
+# (That's how CPython itself implements sys.settrace() on top of sys.monitoring.)
+# So the map is the same as with the trace function backends.
+
+cdef inline PyObject *current_frame():
+    # the frame that triggered the event
+    return <PyObject *> PyEval_GetFrame()
+
+cdef enum:
+    CALL_EVENT = 0
+    RETURN_EVENT = 1
+    EXCEPTION_EVENT = 2
+
+cdef inline int record_offset(CodeInfo info, size_t offset) except -1:
+    cdef int line = info.line_at(offset)
+    if line == 0:
+        # sys.settrace() reports such instructions (some cleanup code)
+        # at the last line seen
+        record_location(last_location)
+    else:
+        record_line(info, line)
+    return 0
+
+cdef bint monitor_event(code, size_t offset, int event) except -1:
+    # handle a call, return or exception event;
+    # return true if the code is excluded
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(code)
+    if info.excluded:
+        stats_stop(info, start)
+        return True
+    # (PY_START and PY_RESUME always come from frames that are traced.)
+    if event != CALL_EVENT and info.maybe_untraced and is_untraced(current_frame(), event == RETURN_EVENT):
+        stats_stop(info, start)
+        return False
+    if event == CALL_EVENT:
+        enter_line_frame(info)
+    record_offset(info, offset)
+    if event == RETURN_EVENT:
+        leave_line_frame(info)
+    stats_stop(info, start)
+    return False
+
+cdef object monitor_call
+def monitor_call(code, size_t instruction_offset):
+    # PY_START or PY_RESUME, line coverage only
+    if monitor_event(code, instruction_offset, CALL_EVENT):
+        return monitoring_disable
+
+cdef object monitor_throw
+def monitor_throw(code, size_t instruction_offset, exception):
+    # PY_THROW can't be disabled
+    monitor_event(code, instruction_offset, CALL_EVENT)
+
+cdef object monitor_return
+def monitor_return(code, size_t instruction_offset, retval):
+    # PY_RETURN or PY_YIELD, line coverage only
+    if monitor_event(code, instruction_offset, RETURN_EVENT):
+        return monitoring_disable
+
+cdef object monitor_unwind
+def monitor_unwind(code, size_t instruction_offset, exception):
+    # PY_UNWIND can't be disabled
+    monitor_event(code, instruction_offset, RETURN_EVENT)
+
+cdef object monitor_stop_iteration
+def monitor_stop_iteration(code, size_t instruction_offset, value):
+    if monitor_event(code, instruction_offset, EXCEPTION_EVENT):
+        return monitoring_disable
+
+cdef object monitor_line
+def monitor_line(code, size_t line_number):
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(code)
+    if info.excluded:
+        stats_stop(info, start)
+        return monitoring_disable
+    if not (info.maybe_untraced and is_untraced(current_frame(), False)):
+        record_line(info, line_number)
+    stats_stop(info, start)
+    # Line events can't be disabled:
+    # the next edge depends on prev_location.
+
+cdef object monitor_jump
+def monitor_jump(code, size_t instruction_offset, size_t destination_offset):
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(code)
+    cdef int line
+    if info.excluded:
+        stats_stop(info, start)
+        return monitoring_disable
+    if not branch_mode:
+        # Jumps within a line backwards (one-line loops) are line events
+        # for sys.settrace(); other jumps are followed by line events anyway,
+        # so they can be disabled for good.
+        line = info.line_at(destination_offset)
+        if destination_offset > instruction_offset or line != info.line_at(instruction_offset):
+            stats_stop(info, start)
+            return monitoring_disable
+    if info.maybe_untraced and is_untraced(current_frame(), False):
+        stats_stop(info, start)
+        return
+    if branch_mode:
+        record_edge(info, instruction_offset, destination_offset, EDGE_JUMP)
+    else:
+        record_offset(info, destination_offset)
+    stats_stop(info, start)
+
+cdef object monitor_start
+def monitor_start(code, size_t instruction_offset):
+    # branch coverage only
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(code)
+    if info.excluded:
+        stats_stop(info, start)
+        return monitoring_disable
+    record_edge(info, 0, 0, EDGE_ENTRY)
+    stats_stop(info, start)
+
+cdef extern from *:
+    '''
+    static AFL_THREAD_LOCAL size_t afl_last_raise_offset = 0;
+    '''
+    size_t last_raise_offset "afl_last_raise_offset"
+
+cdef object monitor_raise
+def monitor_raise(code, size_t instruction_offset, exception):
+    global last_raise_offset
+    cdef uint64_t start
+    cdef CodeInfo info
+    # RAISE is not a local event, so it can't be disabled.
+    if not branch_mode:
+        monitor_event(code, instruction_offset, EXCEPTION_EVENT)
+        return
+    start = stats_start()
+    info = get_code_info(code)
+    if not info.excluded and not (info.maybe_untraced and is_untraced(current_frame(), False)):
+        record_edge(info, instruction_offset, 0, EDGE_RAISE)
+    last_raise_offset = instruction_offset
+    stats_stop(info, start)
+
+cdef object monitor_handled
+def monitor_handled(code, size_t instruction_offset, exception):
+    # branch coverage only
+    cdef uint64_t start = stats_start()
+    cdef CodeInfo info = get_code_info(code)
+    if not info.excluded and not (info.maybe_untraced and is_untraced(current_frame(), False)):
+        record_edge(info, last_raise_offset, instruction_offset, EDGE_HANDLER)
+    stats_stop(info, start)
+
+cdef int monitoring_start() except -1:
+    global monitoring_disable, monitoring_tool
+    events = monitoring.events
+    for tool_id in [monitoring.COVERAGE_ID] + list(range(6)):
+        try:
+            monitoring.use_tool_id(tool_id, 'python-afl')
+        except ValueError:
+            continue
+        break
+    else:
+        raise RuntimeError('no free sys.monitoring tool ID')
+    monitoring_tool = tool_id
+    monitoring_disable = monitoring.DISABLE
+    monitoring_callbacks.clear()
+    monitoring_callbacks[events.JUMP] = monitor_jump
+    monitoring_callbacks[events.RAISE] = monitor_raise
+    if branch_mode:
+        monitoring_callbacks[events.BRANCH] = monitor_jump
+        monitoring_callbacks[events.PY_START] = monitor_start
+        monitoring_callbacks[events.EXCEPTION_HANDLED] = monitor_handled
+    else:
+        monitoring_callbacks[events.LINE] = monitor_line
+        monitoring_callbacks[events.PY_START] = monitor_call
+        monitoring_callbacks[events.PY_RESUME] = monitor_call
+        monitoring_callbacks[events.PY_THROW] = monitor_throw
+        monitoring_callbacks[events.PY_RETURN] = monitor_return
+        monitoring_callbacks[events.PY_YIELD] = monitor_return
+        monitoring_callbacks[events.PY_UNWIND] = monitor_unwind
+        monitoring_callbacks[events.STOP_ITERATION] = monitor_stop_iteration
+    event_set = 0
+    for (event, callback) in monitoring_callbacks.items():
+        monitoring.register_callback(tool_id, event, callback)
+        event_set |= event
+    monitoring.set_events(tool_id, event_set)
+    return 0
+
+cdef int monitoring_stop() except -1:
+    global monitoring_tool
+    monitoring.set_events(monitoring_tool, 0)
+    for event in monitoring_callbacks:
+        monitoring.register_callback(monitoring_tool, event, None)
+    monitoring_callbacks.clear()
+    monitoring.free_tool_id(monitoring_tool)
+    monitoring_tool = -1
+    return 0
+
+cdef object tracer = None
+cdef bint tracing = False
+
+cdef int configure_tracing() except -1:
+    global branch_mode, context_mode, coverage_mode, ngram_size, tracer
+    tracer = os.getenv('PYTHON_AFL_TRACER')
+    if not tracer and import_hook is not None:
+        tracer = 'none'
+    if not tracer:
+        tracer = 'settrace' if monitoring is None else 'monitoring'
+    if tracer not in {'none', 'settrace', 'ctrace', 'monitoring'}:
+        raise RuntimeError('unknown PYTHON_AFL_TRACER: {0!r}'.format(tracer))
+    if tracer == 'monitoring' and monitoring is None:
+        raise RuntimeError('PYTHON_AFL_TRACER=monitoring requires Python >= 3.12')
+    coverage = os.getenv('PYTHON_AFL_COVERAGE') or 'line'
+    match = re.match(r'\Angram-([0-9]+)\Z', coverage)
+    if match and 2 <= int(match.group(1)) <= MAX_NGRAM:
+        ngram_size = int(match.group(1))
+    elif coverage not in {'line', 'branch', 'ctx'}:
+        raise RuntimeError('unknown PYTHON_AFL_COVERAGE: {0!r}'.format(coverage))
+    else:
+        ngram_size = 0
+    coverage_mode = coverage
+    branch_mode = coverage == 'branch'
+    context_mode = coverage == 'ctx'
+    if context_mode and tracer == 'none':
+        raise RuntimeError('PYTHON_AFL_COVERAGE=ctx requires a tracer')
+    if branch_mode and not has_f_trace_flags:
+        raise RuntimeError('PYTHON_AFL_COVERAGE=branch requires Python >= 3.7')
+    return 0
+
+cdef object ctrace_bootstrap
+def ctrace_bootstrap(frame, event, arg):
+    # threading.settrace() accepts only Python trace functions;
+    # this one replaces itself with the C trace function in new threads
+    add_untraced_frames(frame.f_back)
+    PyEval_SetTrace(ctrace, NULL)
+    ctrace(NULL, <PyFrameObject *> frame, PyTrace_CALL, NULL)
+    # the returned value becomes frame.f_trace
+    return frame.f_trace
+
+cdef int start_tracing() except -1:
+    global tracing
+    tracing = True
+    if branch_mode and tracer != 'monitoring':
+        # Python 3.12 delivers opcode events only if f_trace_opcodes
+        # had been ever set before the trace function was installed.
+        frame = sys._getframe()
+        frame.f_trace_opcodes = True
+        frame.f_trace_opcodes = False
+    # sys.monitoring covers all threads;
+    # trace functions have to be installed in every new thread.
+    if tracer == 'settrace':
+        threading.settrace(trace)
+        sys.settrace(trace)
+    elif tracer == 'ctrace':
+        threading.settrace(ctrace_bootstrap)
+        add_untraced_frames(sys._getframe())
+        PyEval_SetTrace(ctrace, NULL)
+    elif tracer == 'monitoring':
+        add_untraced_frames(sys._getframe())
+        monitoring_start()
+    return 0
+
+cdef int stop_tracing() except -1:
+    global tracing
+    if not tracing:
+        return 0
+    tracing = False
+    if tracer == 'settrace':
+        threading.settrace(None)
+        sys.settrace(None)
+    elif tracer == 'ctrace':
+        threading.settrace(None)
+        PyEval_SetTrace(NULL, NULL)
+    elif tracer == 'monitoring':
+        monitoring_stop()
+    clear_untraced_frames()
+    return 0
+
+# Import hook that instruments modules at import time.
+# Probe calls are inserted into the AST at the entries of basic blocks,
+# so that no trace function is needed at all.
+
+cdef object probe
+def probe(unsigned int location):
+    global prev_location
+    cdef unsigned int offset
+    if afl_area == NULL:
+        return
+    if stats_area != NULL:
+        stats_add_location(location)
+    location %= map_size
     offset = location ^ prev_location
+    if ngram_size > 0:
+        offset ^= ngram_offset(location)
     prev_location = location // 2
-    afl_area[offset] += 1
-    # TODO: make it configurable which modules are instrumented, and which are not
-    return trace
+    afl_area_inc(afl_area, offset)
+
+cdef str PROBE_NAME = '__afl_probe__'
+
+cdef object ast_constant(value):
+    if sys.version_info >= (3, 8):
+        return ast.Constant(value=value)
+    return ast.Num(n=value)
+
+cdef object ast_def_types
+if ast is not None:
+    ast_def_types = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+cdef object Instrumenter
+class Instrumenter(ast.NodeTransformer if ast is not None else object):
+
+    def __init__(self, filename):
+        self.filename_hash = fnv_key(filename)
+        self.n_probes = 0
+
+    def probe_call(self, node):
+        self.n_probes += 1
+        location = fnv_word(self.filename_hash, self.n_probes)
+        call = ast.Call(
+            func=ast.Name(id=PROBE_NAME, ctx=ast.Load()),
+            args=[ast_constant(location)],
+            keywords=[],
+        )
+        return ast.copy_location(call, node)
+
+    def probe_stmt(self, node):
+        return ast.copy_location(ast.Expr(value=self.probe_call(node)), node)
+
+    def probe_expr(self, node):
+        # __afl_probe__() returns None,
+        # so “__afl_probe__(...) or node” evaluates to node.
+        expr = ast.BoolOp(op=ast.Or(), values=[self.probe_call(node), self.visit(node)])
+        return ast.copy_location(expr, node)
+
+    def instrument_body(self, body, parent):
+        new_body = []
+        i = 0
+        # docstrings and __future__ imports must stay at the top
+        if isinstance(parent, (ast.Module,) + ast_def_types):
+            if ast.get_docstring(parent, clean=False) is not None:
+                new_body += [body[0]]
+                i = 1
+        while i < len(body) and isinstance(body[i], ast.ImportFrom) and body[i].module == '__future__':
+            new_body += [body[i]]
+            i += 1
+        new_body += [self.probe_stmt(body[i] if i < len(body) else parent)]
+        for j in range(i, len(body)):
+            stmt = body[j]
+            new_body += [self.visit(stmt)]
+            if j + 1 == len(body) or isinstance(stmt, ast_def_types):
+                continue
+            if hasattr(stmt, 'body') or hasattr(stmt, 'cases'):
+                # the statement after a compound statement starts a new block
+                new_body += [self.probe_stmt(body[j + 1])]
+        return new_body
+
+    def generic_visit(self, node):
+        for (field, value) in ast.iter_fields(node):
+            if isinstance(value, ast.AST):
+                setattr(node, field, self.visit(value))
+            elif not isinstance(value, list):
+                pass
+            elif value and isinstance(value[0], ast.stmt):
+                value[:] = self.instrument_body(value, node)
+            else:
+                value[:] = [
+                    self.visit(item) if isinstance(item, ast.AST) else item
+                    for item in value
+                ]
+        return node
+
+    def visit_ClassDef(self, node):
+        # class body is executed only once, at import time
+        node.body = [self.visit(stmt) for stmt in node.body]
+        node.decorator_list = [self.visit(expr) for expr in node.decorator_list]
+        return node
+
+    def visit_Lambda(self, node):
+        node.body = self.probe_expr(node.body)
+        return node
+
+    def visit_IfExp(self, node):
+        node.test = self.visit(node.test)
+        node.body = self.probe_expr(node.body)
+        node.orelse = self.probe_expr(node.orelse)
+        return node
+
+    def visit_BoolOp(self, node):
+        # all operands but the first one are evaluated conditionally
+        node.values = [self.visit(node.values[0])] + [
+            self.probe_expr(value) for value in node.values[1:]
+        ]
+        return node
+
+cdef object instrument_source(source, filename):
+    tree = ast.parse(source, filename)
+    tree = Instrumenter(filename).visit(tree)
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, 'exec', dont_inherit=True)
+
+# The cached code is invalidated whenever the source, the Python version
+# or the python-afl version changes.
+cdef bytes import_hook_cache_magic = ('python-afl ' + __version__).encode('ASCII')
+
+cdef object source_hash(bytes source):
+    if hasattr(importlib_util, 'source_hash'):
+        # Python >= 3.7
+        return importlib_util.source_hash(source)
+    return hashlib.sha256(source).digest()[:8]
+
+cdef object InstrumentingLoader
+class InstrumentingLoader(
+    importlib_machinery.SourceFileLoader if importlib_machinery is not None else object
+):
+
+    def get_code(self, fullname):
+        path = self.get_filename(fullname)
+        source = self.get_data(path)
+        header = importlib_util.MAGIC_NUMBER + import_hook_cache_magic + source_hash(source)
+        cache_path = importlib_util.cache_from_source(path, optimization='afl')
+        try:
+            data = self.get_data(cache_path)
+        except OSError:
+            pass
+        else:
+            if data[:len(header)] == header:
+                return marshal.loads(data[len(header):])
+        code = instrument_source(source, path)
+        try:
+            self.set_data(cache_path, header + marshal.dumps(code))
+        except (OSError, NotImplementedError):
+            pass
+        return code
+
+    def exec_module(self, module):
+        setattr(module, PROBE_NAME, probe)
+        super(InstrumentingLoader, self).exec_module(module)
+
+cdef object ImportHook
+class ImportHook(object):
+
+    def find_spec(self, fullname, path, target=None):
+        spec = importlib_machinery.PathFinder.find_spec(fullname, path, target)
+        if spec is None or type(spec.loader) is not importlib_machinery.SourceFileLoader:
+            return None
+        if include_filter.active and not include_filter.match(spec.origin, fullname):
+            return None
+        if exclude_filter.active and exclude_filter.match(spec.origin, fullname):
+            return None
+        spec.loader = InstrumentingLoader(fullname, spec.origin)
+        return spec
+
+cdef object import_hook = None
+
+def install_import_hook():
+    '''
+    install_import_hook()
+
+    Instrument modules that are imported from now on,
+    by inserting probes into their code.
+    Python >= 3.6 is required for this feature.
+
+    Modules are selected with $PYTHON_AFL_INCLUDE and $PYTHON_AFL_EXCLUDE.
+    Unless $PYTHON_AFL_TRACER is set,
+    the trace function is not used in this mode.
+    '''
+    global exclude_filter, import_hook, include_filter
+    if sys.version_info < (3, 6):
+        raise RuntimeError('the import hook requires Python >= 3.6')
+    if import_hook is not None:
+        return
+    if not init_done:
+        include_filter = Filter(parse_filter(None, 'PYTHON_AFL_INCLUDE'))
+        exclude_filter = Filter(parse_filter(None, 'PYTHON_AFL_EXCLUDE'))
+    import_hook = ImportHook()
+    sys.meta_path.insert(0, import_hook)
 
 cdef int except_signal_id = 0
 cdef object except_signal_name = os.getenv('PYTHON_AFL_SIGNAL') or '0'
@@ -109,84 +1628,592 @@ else:
         except_signal_name = 'SIG' + except_signal_name
     except_signal_id = getattr(signal, except_signal_name)
 
+# Crash signature: the exception type and the place where it was raised.
+# If $PYTHON_AFL_CRASH_FD is set, the signature of an unhandled exception
+# is written to this file descriptor just before the process is killed,
+# so that the fuzzer can tell different crashes apart.
+
+cdef object crash_signature(tp, tb):
+    while tb is not None and tb.tb_next is not None:
+        tb = tb.tb_next
+    location = ''
+    if tb is not None:
+        location = '{0}:{1}'.format(tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+    return '{0}.{1} {2}'.format(tp.__module__, tp.__name__, location)
+
+cdef int crash_fd = int(os.getenv('PYTHON_AFL_CRASH_FD') or -1)
+
+cdef int report_crash(tp, tb) except -1:
+    if crash_fd < 0:
+        return 0
+    line = crash_signature(tp, tb).replace('\n', ' ') + '\n'
+    try:
+        os.write(crash_fd, line.encode('UTF-8', 'replace'))
+    except OSError:
+        pass
+    return 0
+
 cdef object excepthook
 def excepthook(tp, value, traceback):
+    report_crash(tp, traceback)
+    # the signal bypasses atexit
+    log_dirty_pages()
     os.kill(os.getpid(), except_signal_id)
 
 cdef bint init_done = False
-cdef bint tstl_mode = False
 
-cdef int _init(bint persistent_mode) except -1:
-    global afl_area, init_done, tstl_mode
-    tstl_mode = os.getenv('PYTHON_AFL_TSTL') is not None
+# In the pipe persistent mode, the child reports the end of an iteration
+# by writing a byte to persistent_done_fd,
+# and waits for a byte from persistent_go_fd before starting the next one.
+cdef int persistent_go_fd = -1
+cdef int persistent_done_fd = -1
+
+cdef int set_map_size(size) except -1:
+    global map_size
+    if size is None:
+        size = os.getenv('AFL_MAP_SIZE') or MAP_SIZE
+    size = int(size)
+    if not 1 < size <= FS_OPT_MAX_MAPSIZE:
+        raise ValueError('invalid map size: {0}'.format(size))
+    if size != map_size:
+        # location IDs are reduced modulo the map size
+        code_cache.clear()
+        map_size = size
+    return 0
+
+cdef Py_ssize_t shm_size(int id) except -1:
+    cdef shmid_ds shm_info
+    if shmctl(id, IPC_STAT, &shm_info) != 0:
+        PyErr_SetFromErrno(OSError)
+    return <Py_ssize_t> shm_info.shm_segsz
+
+cdef unsigned char *shm_attach(int id) except NULL:
+    cdef unsigned char *area = shmat(id, NULL, 0)
+    if area == <void*> -1:
+        PyErr_SetFromErrno(OSError)
+    return area
+
+cdef int attach_shm(const char *shm_id) except -1:
+    global afl_area
+    cdef int id = int(shm_id)
+    cdef size_t size = shm_size(id)
+    if size < map_size:
+        raise RuntimeError(
+            'shared memory segment is smaller than the map size: {0} < {1}'.format(
+                size, map_size
+            )
+        )
+    afl_area = shm_attach(id)
+    return 0
+
+cdef int attach_testcase_shm(const char *shm_id) except -1:
+    global afl_testcase_area, afl_testcase_area_size
+    cdef int id = int(shm_id)
+    cdef size_t size = shm_size(id)
+    if size < 4:
+        raise RuntimeError('test case shared memory segment is too small')
+    afl_testcase_area = shm_attach(id)
+    afl_testcase_area_size = size
+    return 0
+
+# Copy-on-write friendliness:
+# objects that survived gc.freeze() are never examined by the cyclic GC,
+# so the GC doesn't dirty the pages that the children share with the parent.
+
+cdef object parse_child_gc():
+    # return None (leave GC alone), False (disable GC),
+    # or a tuple of GC thresholds
+    value = os.getenv('PYTHON_AFL_CHILD_GC')
+    if not value:
+        return None
+    if value == 'disable':
+        return False
+    try:
+        thresholds = tuple(int(n) for n in value.split(','))
+    except ValueError:
+        thresholds = ()
+    if not 1 <= len(thresholds) <= 3 or min(thresholds) < 0:
+        raise RuntimeError('invalid PYTHON_AFL_CHILD_GC: {0!r}'.format(value))
+    return thresholds
+
+cdef int configure_child_gc(setting) except -1:
+    if setting is False:
+        gc.disable()
+    elif setting is not None:
+        gc.set_threshold(*setting)
+    return 0
+
+cdef object dirty_pages_log = None
+
+cdef object count_dirty_pages():
+    # return the number of private dirty pages of this process,
+    # or None if this information is not available
+    try:
+        with open('/proc/self/smaps_rollup', 'rb') as file:
+            for line in file:
+                if line.startswith(b'Private_Dirty:'):
+                    # the value is always in kB
+                    kib = line.split()[1]
+                    return int(kib) * 1024 // os.sysconf('SC_PAGE_SIZE')
+    except IOError:
+        pass
+    return None
+
+cdef object log_dirty_pages
+def log_dirty_pages():
+    if dirty_pages_log is None:
+        return
+    pages = count_dirty_pages()
+    if pages is None:
+        return
+    line = '{pid} {pages}\n'.format(pid=os.getpid(), pages=pages)
+    fd = os.open(dirty_pages_log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        os.write(fd, line.encode('ASCII'))
+    finally:
+        os.close(fd)
+
+# Statistics mode, continued:
+
+cdef int stats_init() except -1:
+    global stats_area, stats_area_size, stats_locations, stats_map, stats_path
+    stats_path = os.getenv('PYTHON_AFL_STATS') or None
+    if stats_path is None or getenv(SHM_ENV_VAR) == NULL:
+        return 0
+    cdef size_t size = (
+        sizeof(stats_header) +
+        map_size * STATS_LOCATION_WAYS * sizeof(uint32_t) +
+        map_size
+    )
+    # the mapping is shared with all the forked children
+    cdef void *area = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_ANONYMOUS, -1, 0)
+    if area == MAP_FAILED:
+        PyErr_SetFromErrno(OSError)
+    stats_area = <stats_header *> area
+    stats_area_size = size
+    stats_locations = <uint32_t *> (<char *> area + sizeof(stats_header))
+    stats_map = <unsigned char *> (stats_locations + map_size * STATS_LOCATION_WAYS)
+    return 0
+
+cdef void stats_merge():
+    # add the map of the last run to the union of all maps
+    cdef size_t i
+    stats_area.execs += 1
+    if afl_area == NULL:
+        return
+    for i in range(map_size):
+        if afl_area[i]:
+            stats_map[i] = 1
+
+cdef int stats_dump() except -1:
+    if stats_area == NULL:
+        return 0
+    cdef size_t i, j, n
+    cdef stats_code *code
+    code_stats = []
+    file_stats = {}
+    total_events = 0
+    total_time = 0.0
+    for i in range(<size_t> STATS_CODE_SLOTS):
+        code = &stats_area.code[i]
+        if code.events == 0:
+            continue
+        if i == 0:
+            # code objects that didn't fit in the table
+            filename = name = None
+        else:
+            filename = (<bytes> code.filename).decode('UTF-8', 'replace')
+            name = (<bytes> code.qualname).decode('UTF-8', 'replace')
+        time_spent = code.time_ns / 1E9
+        code_stats += [dict(
+            filename=filename,
+            name=name,
+            line=code.first_line,
+            events=code.events,
+            time=time_spent,
+        )]
+        item = file_stats.setdefault(filename, dict(filename=filename, events=0, time=0.0))
+        item['events'] += code.events
+        item['time'] += time_spent
+        total_events += code.events
+        total_time += time_spent
+    used = locations = colliding = 0
+    for i in range(map_size):
+        if stats_map[i]:
+            used += 1
+        n = 0
+        for j in range(<size_t> STATS_LOCATION_WAYS):
+            if stats_locations[i * STATS_LOCATION_WAYS + j]:
+                n += 1
+        locations += n
+        if n > 1:
+            colliding += n
+    # what to expect if the location IDs were uniformly random:
+    expected_collision_rate = 0.0
+    if locations > 1:
+        expected_collision_rate = 1 - (1 - 1.0 / map_size) ** (locations - 1)
+    data = dict(
+        pid=os.getpid(),
+        tracer=tracer,
+        coverage=coverage_mode,
+        execs=stats_area.execs,
+        events=total_events,
+        callback_time=total_time,
+        files=sorted(file_stats.values(), key=stats_sort_key),
+        code=sorted(code_stats, key=stats_sort_key),
+        map=dict(
+            size=map_size,
+            used=used,
+            density=float(used) / map_size,
+            locations=locations,
+            colliding_locations=colliding,
+            collision_rate=float(colliding) / locations if locations else 0.0,
+            expected_collision_rate=expected_collision_rate,
+        ),
+    )
+    with open(stats_path, 'w') as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write('\n')
+    return 0
+
+cdef object stats_sort_key
+def stats_sort_key(item):
+    # the busiest first
+    return (-item['events'], item['filename'] or '')
+
+cdef object stats_atexit
+def stats_atexit():
+    # without the fork server, there's only one run
+    stats_merge()
+    stats_dump()
+
+cdef object stats_sigterm
+def stats_sigterm(signum, frame):
+    # afl-fuzz stops the fork server with SIGTERM
+    stats_dump()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+# Low-level I/O helpers for the fork server.
+# Interrupted system calls are restarted,
+# unless a signal handler raised an exception.
+
+cdef int read_all(int fd, void *buf, size_t size) except -1:
+    cdef ssize_t n
+    cdef char *p = <char *> buf
+    while size > 0:
+        n = read(fd, p, size)
+        if n < 0:
+            if errno.errno == errno.EINTR:
+                PyErr_CheckSignals()
+                continue
+            PyErr_SetFromErrno(OSError)
+        if n == 0:
+            raise EOFError
+        p += n
+        size -= n
+    return 0
+
+cdef int write_all(int fd, const void *buf, size_t size) except -1:
+    cdef ssize_t n
+    cdef const char *p = <const char *> buf
+    while size > 0:
+        n = write(fd, p, size)
+        if n < 0:
+            if errno.errno == errno.EINTR:
+                PyErr_CheckSignals()
+                continue
+            PyErr_SetFromErrno(OSError)
+        p += n
+        size -= n
+    return 0
+
+cdef ssize_t read_byte(int fd) except -1:
+    # return 0 on EOF
+    cdef char byte
+    cdef ssize_t n
+    while True:
+        n = read(fd, &byte, 1)
+        if n >= 0:
+            return n
+        if errno.errno != errno.EINTR:
+            PyErr_SetFromErrno(OSError)
+        PyErr_CheckSignals()
+
+cdef pid_t wait_for(pid_t pid, int *status, int options) except -1:
+    cdef pid_t rc
+    while True:
+        rc = waitpid(pid, status, options)
+        if rc >= 0:
+            return rc
+        if errno.errno != errno.EINTR:
+            PyErr_SetFromErrno(OSError)
+        PyErr_CheckSignals()
+
+cdef int make_pipe(int fds[2]) except -1:
+    if pipe(fds) != 0:
+        PyErr_SetFromErrno(OSError)
+    fcntl(fds[0], F_SETFD, FD_CLOEXEC)
+    fcntl(fds[1], F_SETFD, FD_CLOEXEC)
+    return 0
+
+cdef extern from *:
+    '''
+    #if PY_VERSION_HEX >= 0x03070000
+    #define afl_before_fork() PyOS_BeforeFork()
+    #define afl_after_fork_parent() PyOS_AfterFork_Parent()
+    #define afl_after_fork_child() PyOS_AfterFork_Child()
+    #else
+    #define afl_before_fork() ((void) 0)
+    #define afl_after_fork_parent() ((void) 0)
+    #define afl_after_fork_child() PyOS_AfterFork()
+    #endif
+    '''
+    void afl_before_fork()
+    void afl_after_fork_parent()
+    void afl_after_fork_child()
+
+cdef pid_t spawn_child(bint pipe_mode, int go_fds[2], int done_fds[2]) except -1:
+    # fork; return 0 in the child
+    global persistent_go_fd, persistent_done_fd
+    cdef pid_t pid
+    if pipe_mode:
+        if go_fds[1] >= 0:
+            close(go_fds[1])
+            close(done_fds[0])
+        make_pipe(go_fds)
+        make_pipe(done_fds)
+    afl_before_fork()
+    pid = fork()
+    if pid == 0:
+        afl_after_fork_child()
+        if pipe_mode:
+            close(go_fds[1])
+            close(done_fds[0])
+            persistent_go_fd = go_fds[0]
+            persistent_done_fd = done_fds[1]
+        return 0
+    afl_after_fork_parent()
+    if pid < 0:
+        PyErr_SetFromErrno(OSError)
+    if pipe_mode:
+        close(go_fds[0])
+        close(done_fds[1])
+    return pid
+
+cdef int forkserver_loop(bint persistent_mode, bint pipe_mode, bint prefork) except -1:
+    # Serve fork requests from afl-fuzz.
+    # This function returns only in the child process.
+    cdef uint32_t child_killed, msg
+    cdef int status
+    cdef bint child_stopped = False
+    cdef pid_t child_pid = 0
+    cdef int go_fds[2]
+    cdef int done_fds[2]
+    # In the prefork mode, the next child is forked in advance,
+    # and then it waits until the fork server writes to its park pipe.
+    cdef pid_t parked_pid = 0
+    cdef int park_fds[2]
+    cdef char byte = 0
+    cdef ssize_t n
+    # status of a process stopped by SIGSTOP
+    cdef int stopped_status = SIGSTOP << 8 | 0x7F
+    go_fds[1] = done_fds[0] = -1
+    while True:
+        if prefork and parked_pid == 0 and not child_stopped:
+            make_pipe(park_fds)
+            parked_pid = spawn_child(pipe_mode, go_fds, done_fds)
+            if parked_pid == 0:
+                close(park_fds[1])
+                n = read_byte(park_fds[0])
+                close(park_fds[0])
+                if n == 0:
+                    # the fork server is gone
+                    _exit(0)
+                return 0
+            close(park_fds[0])
+        # run signal handlers that are pending since the last read
+        PyErr_CheckSignals()
+        read_all(FORKSRV_FD, &child_killed, 4)
+        if child_stopped and child_killed:
+            wait_for(child_pid, &status, 0)
+            child_stopped = False
+        if child_stopped:
+            if pipe_mode:
+                write_all(go_fds[1], &byte, 1)
+            elif kill(child_pid, SIGCONT) != 0:
+                PyErr_SetFromErrno(OSError)
+            child_stopped = False
+        elif parked_pid > 0:
+            child_pid = parked_pid
+            parked_pid = 0
+            write_all(park_fds[1], &byte, 1)
+            close(park_fds[1])
+        else:
+            child_pid = spawn_child(pipe_mode, go_fds, done_fds)
+            if child_pid == 0:
+                return 0
+        msg = <uint32_t> child_pid
+        write_all(FORKSRV_FD + 1, &msg, 4)
+        n = 0
+        if pipe_mode:
+            n = read_byte(done_fds[0])
+        if n > 0:
+            # pretend that the child was stopped, as afl-fuzz expects
+            status = stopped_status
+        else:
+            # EOF on the done pipe means the child has exited
+            wait_for(child_pid, &status, WUNTRACED if persistent_mode else 0)
+        child_stopped = WIFSTOPPED(status)
+        if stats_area != NULL:
+            stats_merge()
+        if id_table is not None:
+            # pick up IDs allocated by the child,
+            # so that the next children don't have to look them up
+            id_table.load()
+        msg = <uint32_t> status
+        write_all(FORKSRV_FD + 1, &msg, 4)
+
+cdef int configure_instrumentation(includes, excludes, size) except -1:
+    global code_cache_size, exclude_filter, include_filter
+    includes = parse_filter(includes, 'PYTHON_AFL_INCLUDE')
+    excludes = parse_filter(excludes, 'PYTHON_AFL_EXCLUDE')
+    if os.getenv('PYTHON_AFL_TSTL') is not None:
+        excludes += ['sut.py', '*/sut.py']
+    include_filter = Filter(includes)
+    exclude_filter = Filter(excludes)
+    code_cache_size = int(os.getenv('PYTHON_AFL_CODE_CACHE_SIZE') or code_cache_size)
+    set_map_size(size)
+    configure_id_table()
+    return 0
+
+cdef int _init(
+    bint persistent_mode, bint prewarm=False, includes=None, excludes=None, size=None,
+    bint shared_input=False,
+) except -1:
+    global dirty_pages_log, init_done
+    if init_done:
+        raise RuntimeError('AFL already initialized')
+    configure_instrumentation(includes, excludes, size)
+    prewarm = prewarm or os.getenv('PYTHON_AFL_PREWARM') is not None
+    child_gc = parse_child_gc()
+    # announce the map size with the AFL++ fork server options;
+    # the original afl-fuzz ignores the contents of this message
+    hello = FS_OPT_ENABLED | FS_OPT_MAPSIZE | FS_OPT_SET_MAPSIZE(map_size)
+    cdef const char *testcase_shm_id = getenv(SHM_FUZZ_ENV_VAR)
+    shared_input = shared_input and testcase_shm_id != NULL
+    if shared_input:
+        hello |= FS_OPT_SHDMEM_FUZZ
     use_forkserver = True
     try:
-        os.write(FORKSRV_FD + 1, b'\0\0\0\0')
+        os.write(FORKSRV_FD + 1, struct.pack('I', hello))
     except OSError as exc:
         if exc.errno == errno.EBADF:
             use_forkserver = False
         else:
             raise
-    if init_done:
-        raise RuntimeError('AFL already initialized')
     init_done = True
-    child_stopped = False
-    child_pid = 0
+    if use_forkserver and shared_input:
+        # afl-fuzz confirms that it will deliver test cases through shared memory
+        [reply] = struct.unpack('I', os.read(FORKSRV_FD, 4))
+        if reply != FS_OPT_ENABLED | FS_OPT_SHDMEM_FUZZ:
+            raise RuntimeError('unexpected fork server reply: {0:#x}'.format(reply))
+        # the attachment is inherited by the children
+        attach_testcase_shm(testcase_shm_id)
+    configure_tracing()
+    stats_init()
+    if prewarm and getenv(SHM_ENV_VAR) != NULL:
+        prewarm_code_cache()
+    pipe_mode = persistent_mode and os.getenv('PYTHON_AFL_PERSISTENT_PIPE') is not None
+    prefork = os.getenv('PYTHON_AFL_PREFORK') is not None
+    if use_forkserver and os.getenv('PYTHON_AFL_GC_FREEZE') is not None:
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            # Python >= 3.7
+            gc.freeze()
     cdef sigaction_t old_sigchld
     cdef sigaction_t dfl_sigchld
     dfl_sigchld.sa_handler = SIG_DFL
     dfl_sigchld.sa_sigaction = NULL
     dfl_sigchld.sa_flags = 0
     sigemptyset(&dfl_sigchld.sa_mask)
+    old_sigterm = None
     if use_forkserver:
-        rc = sigaction(signal.SIGCHLD, &dfl_sigchld, &old_sigchld)
+        rc = sigaction(SIGCHLD, &dfl_sigchld, &old_sigchld)
         if rc:
             PyErr_SetFromErrno(OSError)
-    while use_forkserver:
-        [child_killed] = struct.unpack('I', os.read(FORKSRV_FD, 4))
-        if child_stopped and child_killed:
-            os.waitpid(child_pid, 0)
-            child_stopped = False
-        if child_stopped:
-            os.kill(child_pid, signal.SIGCONT)
-            child_stopped = False
-        else:
-            child_pid = os.fork()
-            if not child_pid:
-                # child:
-                break
-        # parent:
-        os.write(FORKSRV_FD + 1, struct.pack('I', child_pid))
-        (child_pid, status) = os.waitpid(child_pid, os.WUNTRACED if persistent_mode else 0)
-        child_stopped = os.WIFSTOPPED(status)
-        os.write(FORKSRV_FD + 1, struct.pack('I', status))
-    if use_forkserver:
-        rc = sigaction(signal.SIGCHLD, &old_sigchld, NULL)
+        if stats_area != NULL:
+            # the fork server looks at the maps of all runs
+            attach_shm(getenv(SHM_ENV_VAR))
+            old_sigterm = signal.signal(signal.SIGTERM, stats_sigterm)
+        try:
+            forkserver_loop(persistent_mode, pipe_mode, prefork)
+        except EOFError:
+            # the fuzzer has gone away
+            stats_dump()
+            _exit(0)
+        # child:
+        rc = sigaction(SIGCHLD, &old_sigchld, NULL)
         if rc:
             PyErr_SetFromErrno(OSError)
-        os.close(FORKSRV_FD)
-        os.close(FORKSRV_FD + 1)
+        if stats_area != NULL:
+            signal.signal(signal.SIGTERM, old_sigterm)
+        close(FORKSRV_FD)
+        close(FORKSRV_FD + 1)
+    elif stats_area != NULL:
+        atexit.register(stats_atexit)
+    configure_child_gc(child_gc)
+    dirty_pages_log = os.getenv('PYTHON_AFL_DIRTY_PAGES_LOG') or None
+    if dirty_pages_log is not None and not persistent_mode:
+        # in the persistent mode, afl.loop() logs after every iteration
+        atexit.register(log_dirty_pages)
     if except_signal_id != 0:
         sys.excepthook = excepthook
     cdef const char * afl_shm_id = getenv(SHM_ENV_VAR)
     if afl_shm_id == NULL:
         return 0
-    afl_area = shmat(int(afl_shm_id), NULL, 0)
-    if afl_area == <void*> -1:
-        PyErr_SetFromErrno(OSError)
-    sys.settrace(trace)
+    if afl_area == NULL:
+        attach_shm(afl_shm_id)
+    start_tracing()
     return 0
 
-def init():
+def init(prewarm=False, **kwargs):
+    # “include” is a reserved word in Cython,
+    # so the filter arguments have to be passed through **kwargs.
     '''
-    init()
+    init(prewarm=False, include=None, exclude=None, map_size=None, shared_input=False)
 
     Start the fork server and enable instrumentation.
 
     This function should be called as late as possible,
     but before the input is read.
+
+    If prewarm is true, location IDs for all functions
+    that already exist are computed before the first fork,
+    so that the children don't have to do it over and over again.
+
+    include and exclude are lists of module names or path globs
+    that select which code is instrumented.
+    They override $PYTHON_AFL_INCLUDE and $PYTHON_AFL_EXCLUDE.
+
+    map_size is the size of the coverage map;
+    it overrides $AFL_MAP_SIZE.
+    The default is 65536.
+
+    If shared_input is true, and the fuzzer supports it,
+    the input is delivered through shared memory instead of a file;
+    use afl.testcase() to read it.
     '''
-    _init(persistent_mode=False)
+    includes = kwargs.pop('include', None)
+    excludes = kwargs.pop('exclude', None)
+    size = kwargs.pop('map_size', None)
+    shared_input = kwargs.pop('shared_input', False)
+    for key in kwargs:
+        raise TypeError('init() got an unexpected keyword argument {0!r}'.format(key))
+    _init(
+        persistent_mode=False, prewarm=prewarm, includes=includes, excludes=excludes, size=size,
+        shared_input=shared_input,
+    )
 
 def start():
     '''
@@ -198,38 +2225,1029 @@ def start():
 cdef bint persistent_allowed = False
 cdef unsigned long persistent_counter = 0
 
-def loop(max=None):
+def loop(max=None, shared_input=False):
     '''
-    while loop([max]):
+    while loop([max], shared_input=False):
         ...
 
     Start the fork server and enable instrumentation,
     then run the code inside the loop body in persistent mode.
 
+    If shared_input is true, and the fuzzer supports it,
+    the input is delivered through shared memory instead of a file;
+    use afl.testcase() to read it.
+
     afl-fuzz >= 1.82b is required for this feature.
     '''
-    global persistent_allowed, persistent_counter, prev_location
-    prev_location = 0
+    global persistent_allowed, persistent_counter, stdin_testcase
+    reset_edge_state()
+    stdin_testcase = None
     if persistent_counter == 0:
         persistent_allowed = os.getenv('PYTHON_AFL_PERSISTENT') is not None
-        _init(persistent_mode=persistent_allowed)
+        _init(
+            persistent_mode=persistent_allowed, prewarm=False, includes=None, excludes=None, size=None,
+            shared_input=shared_input,
+        )
         persistent_counter = 1
         return True
+    log_dirty_pages()
     cont = persistent_allowed and (
         max is None or
         persistent_counter < max
     )
-    if cont:
+    if cont and persistent_go_fd >= 0:
+        os.write(persistent_done_fd, b'\0')
+        # EOF means the fork server is gone
+        cont = len(os.read(persistent_go_fd, 1)) > 0
+    elif cont:
         os.kill(os.getpid(), signal.SIGSTOP)
+    if cont:
         persistent_counter += 1
         return True
     else:
-        sys.settrace(None)
+        stop_tracing()
         return False
 
+def run_async(function, max=None):
+    '''
+    run_async(function, max=None)
+
+    Persistent mode for asyncio programs.
+    This is equivalent to
+
+        while afl.loop(max):
+            asyncio.run(function())
+
+    except that the same event loop is used for all iterations.
+    '''
+    import asyncio
+    event_loop = None
+    try:
+        while loop(max):
+            if event_loop is None:
+                # The event loop is created in the child,
+                # so that the fork server doesn't share it with anybody.
+                event_loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(event_loop)
+            event_loop.run_until_complete(function())
+    finally:
+        if event_loop is not None:
+            try:
+                event_loop.run_until_complete(event_loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                event_loop.close()
+
+cdef inline size_t shared_testcase_size():
+    cdef size_t size = (<uint32_t *> afl_testcase_area)[0]
+    if size > afl_testcase_area_size - 4:
+        size = afl_testcase_area_size - 4
+    return size
+
+cdef object decode_errors = 'surrogateescape' if sys.version_info >= (3,) else 'replace'
+
+cdef int run_one_input(test_one_input, bytes data, bint bytes_input) except -1:
+    try:
+        if bytes_input:
+            test_one_input(data)
+        else:
+            test_one_input(data.decode('UTF-8', decode_errors))
+    except Exception:
+        if except_signal_id != 0:
+            (tp, value, tb) = sys.exc_info()
+            report_crash(tp, tb)
+            os.kill(os.getpid(), except_signal_id)
+        raise
+    return 0
+
+cdef bint fuzzer_attached():
+    if getenv(SHM_ENV_VAR) != NULL:
+        return True
+    # afl-fuzz in the dumb mode doesn't set $__AFL_SHM_ID,
+    # but it may still run the fork server
+    return fcntl(FORKSRV_FD, F_GETFD) != -1
+
+def fuzz(test_one_input, max_iterations=None, bytes_input=True):
+    '''
+    fuzz(test_one_input, max_iterations=None, bytes_input=True)
+
+    Call test_one_input(data) for every input, in persistent mode.
+
+    The input is delivered through shared memory if possible;
+    otherwise it is read from the file named by the first command-line argument,
+    or from stdin.
+    If bytes_input is false, the input is decoded from UTF-8
+    (with the surrogateescape error handler) before it's passed on.
+
+    If test_one_input raises an exception,
+    the process is killed with the $PYTHON_AFL_SIGNAL signal.
+
+    If no fuzzer is attached, the function runs test_one_input()
+    once for every file named on the command line (or for stdin),
+    and then returns.
+    But if $PYTHON_AFL_ENGINE is set, it runs the built-in fuzzing engine.
+    '''
+    args = sys.argv[1:]
+    if not fuzzer_attached() and os.getenv('PYTHON_AFL_ENGINE'):
+        run_engine(test_one_input, bytes_input)
+        return
+    if not fuzzer_attached():
+        if not args:
+            args = [None]
+        for path in args:
+            data = read_input(0) if path is None else read_input_file(path)
+            run_one_input(test_one_input, data, bytes_input)
+        return
+    path = args[0] if args else None
+    if not bytes_input:
+        # load the codec now, so that it doesn't add coverage to the first input
+        b''.decode('UTF-8', decode_errors)
+    while loop(max_iterations, shared_input=True):
+        if afl_testcase_area != NULL:
+            data = (<char *> afl_testcase_area + 4)[:shared_testcase_size()]
+        elif path is None:
+            data = read_input(0)
+        else:
+            # afl-fuzz creates a new file for every input
+            data = read_input_file(path)
+        run_one_input(test_one_input, data, bytes_input)
+
+cdef object stdin_testcase = None
+
+# buffer for reading inputs, reused between iterations:
+cdef char *input_buffer = NULL
+cdef size_t input_buffer_size = 0
+
+cdef bytes read_input(int fd):
+    # read the whole file, from the beginning if possible
+    global input_buffer, input_buffer_size
+    cdef size_t size = 0
+    cdef ssize_t n
+    cdef char *new_buffer
+    if lseek(fd, 0, SEEK_SET) < 0 and errno.errno != errno.ESPIPE:
+        PyErr_SetFromErrno(OSError)
+    while True:
+        if size == input_buffer_size:
+            new_buffer = <char *> realloc(input_buffer, size * 2 if size else (1 << 16))
+            if new_buffer == NULL:
+                raise MemoryError
+            input_buffer = new_buffer
+            input_buffer_size = size * 2 if size else (1 << 16)
+        n = read(fd, input_buffer + size, input_buffer_size - size)
+        if n < 0:
+            if errno.errno == errno.EINTR:
+                PyErr_CheckSignals()
+                continue
+            PyErr_SetFromErrno(OSError)
+        if n == 0:
+            break
+        size += n
+    return input_buffer[:size]
+
+cdef bytes read_input_file(path):
+    cdef int fd = os.open(path, os.O_RDONLY)
+    try:
+        return read_input(fd)
+    finally:
+        os.close(fd)
+
+def testcase():
+    '''
+    testcase() -> memoryview
+
+    Return the current input.
+
+    If the input is delivered through shared memory
+    (see the shared_input argument of afl.init() and afl.loop()),
+    the returned read-only memoryview refers directly to the shared memory,
+    and it is valid only until the next iteration of afl.loop().
+    Otherwise, the input is read from stdin.
+    '''
+    global stdin_testcase
+    if afl_testcase_area != NULL:
+        return afl_memoryview(afl_testcase_area + 4, shared_testcase_size())
+    if stdin_testcase is None:
+        stdin_testcase = memoryview(read_input(0))
+    return stdin_testcase
+
+# In-process fuzzing engine:
+# afl.fuzz() can generate and run the inputs by itself,
+# without afl-fuzz, the fork server, or any per-input IPC.
+# The coverage map is private to every worker process;
+# inputs that found new coverage are shared through the queue directory.
+
+# hit counts are put into buckets the same way as in afl-fuzz:
+cdef unsigned char count_class[256]
+
+cdef int init_count_classes() except -1:
+    cdef int i
+    count_class[0] = 0
+    count_class[1] = 1
+    count_class[2] = 2
+    count_class[3] = 4
+    for i in range(4, 256):
+        if i < 8:
+            count_class[i] = 8
+        elif i < 16:
+            count_class[i] = 16
+        elif i < 32:
+            count_class[i] = 32
+        elif i < 128:
+            count_class[i] = 64
+        else:
+            count_class[i] = 128
+    return 0
+
+init_count_classes()
+
+cdef enum:
+    NO_NEW_BITS = 0
+    NEW_HIT_COUNTS = 1
+    NEW_EDGES = 2
+    CRASHED = 3
+
+cdef int has_new_bits(unsigned char *virgin, const unsigned char *trace, size_t size):
+    # virgin has bits set for the bucketed hit counts not seen so far;
+    # clear those that trace has hit, and tell what was new
+    cdef int result = NO_NEW_BITS
+    cdef size_t i = 0
+    cdef unsigned char bucket
+    while i < size:
+        if i % 8 == 0 and i + 8 <= size and (<const uint64_t *> (trace + i))[0] == 0:
+            # most of the map is empty
+            i += 8
+            continue
+        if trace[i] != 0:
+            bucket = count_class[trace[i]]
+            if bucket & virgin[i]:
+                if virgin[i] == 0xFF:
+                    result = NEW_EDGES
+                elif result == NO_NEW_BITS:
+                    result = NEW_HIT_COUNTS
+                virgin[i] &= ~bucket
+        i += 1
+    return result
+
+cdef extern from *:
+    '''
+    static inline uint64_t afl_rand_next(uint64_t *state)
+    {
+        /* xorshift64* */
+        uint64_t x = *state;
+        x ^= x >> 12;
+        x ^= x << 25;
+        x ^= x >> 27;
+        *state = x;
+        return x * 0x2545F4914F6CDD1DULL;
+    }
+    #define afl_rand_below(state, n) ((size_t) (afl_rand_next(state) % (n)))
+    '''
+    size_t rand_below "afl_rand_below" (uint64_t *state, size_t n)
+
+cdef signed char interesting_8[9]
+interesting_8[:] = [-128, -1, 0, 1, 16, 32, 64, 100, 127]
+cdef short interesting_16[10]
+interesting_16[:] = [-32768, -129, 128, 255, 256, 512, 1000, 1024, 4096, 32767]
+cdef int interesting_32[8]
+interesting_32[:] = [-2147483648, -100663046, -32769, 32768, 65535, 65536, 100663045, 2147483647]
+
+cdef enum:
+    MAX_BLOCK_LEN = 32
+    MAX_ARITH = 35
+
+cdef bint write_new_file(path, bytes data) except -1:
+    # create the file atomically, unless it already exists;
+    # other workers may be reading the directory
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(tmp_path))
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    try:
+        os.link(tmp_path, path)
+    except OSError as exc:
+        if exc.errno == errno.EEXIST:
+            return False
+        raise
+    finally:
+        os.unlink(tmp_path)
+    return True
+
+cdef int make_dirs(path) except -1:
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    return 0
+
+cdef list read_seeds(path):
+    seeds = []
+    if path is None:
+        return seeds
+    for name in sorted(os.listdir(path)):
+        name = os.path.join(path, name)
+        if os.path.isfile(name):
+            seeds += [read_input_file(name)]
+    return seeds
+
+@cython.internal
+cdef class Engine:
+
+    cdef object test_one_input
+    cdef bint bytes_input
+    cdef int worker
+    cdef object queue_dir
+    cdef object crashes_dir
+    cdef uint64_t rng
+    cdef unsigned char *virgin
+    cdef unsigned char *buf
+    cdef size_t buf_size
+    cdef size_t max_len
+    cdef list corpus
+    cdef set synced
+    cdef unsigned long execs
+    cdef unsigned long queued
+    cdef unsigned long crashes
+    cdef unsigned long unique_crashes
+    cdef double start_time
+    cdef double last_sync
+    cdef double last_report
+
+    def __cinit__(self, test_one_input, bint bytes_input, output_dir, int worker, uint64_t seed, size_t max_len):
+        self.test_one_input = test_one_input
+        self.bytes_input = bytes_input
+        self.worker = worker
+        self.queue_dir = os.path.join(output_dir, 'queue')
+        self.crashes_dir = os.path.join(output_dir, 'crashes')
+        # xorshift must not be seeded with 0
+        self.rng = (seed + <uint64_t> worker * <uint64_t> 0x9E3779B97F4A7C15) | 1
+        self.max_len = max_len
+        self.virgin = <unsigned char *> calloc(map_size, 1)
+        self.buf = <unsigned char *> calloc(max_len + 1, 1)
+        if self.virgin == NULL or self.buf == NULL:
+            raise MemoryError
+        memset(self.virgin, 0xFF, map_size)
+        self.corpus = []
+        self.synced = set()
+        self.start_time = self.last_sync = self.last_report = time.time()
+
+    def __dealloc__(self):
+        free(self.virgin)
+        free(self.buf)
+
+    cdef int log(self, message) except -1:
+        sys.stderr.write('[worker {0}] {1}\n'.format(self.worker, message))
+        sys.stderr.flush()
+        return 0
+
+    cdef int report(self) except -1:
+        cdef size_t i
+        cdef size_t edges = 0
+        for i in range(map_size):
+            edges += self.virgin[i] != 0xFF
+        elapsed = time.time() - self.start_time
+        self.log('execs: {0}, exec/s: {1:.0f}, corpus: {2}, edges: {3}, crashes: {4} ({5} unique)'.format(
+            self.execs,
+            self.execs / elapsed if elapsed > 0 else 0,
+            len(self.corpus),
+            edges,
+            self.crashes,
+            self.unique_crashes,
+        ))
+        self.last_report = time.time()
+        return 0
+
+    cdef int execute(self, bytes data) except -1:
+        memset(afl_area, 0, map_size)
+        reset_edge_state()
+        self.execs += 1
+        try:
+            if self.bytes_input:
+                self.test_one_input(data)
+            else:
+                self.test_one_input(data.decode('UTF-8', decode_errors))
+        except Exception:  # pylint: disable=broad-except
+            self.save_crash(data)
+            return CRASHED
+        return has_new_bits(self.virgin, afl_area, map_size)
+
+    cdef int save_crash(self, bytes data) except -1:
+        # crashes are told apart by the exception type
+        # and the place where it was raised
+        (tp, value, tb) = sys.exc_info()
+        self.crashes += 1
+        signature = crash_signature(tp, tb)
+        digest = hashlib.sha1(signature.encode('UTF-8', 'replace')).hexdigest()
+        path = os.path.join(self.crashes_dir, 'crash-' + digest[:16])
+        if not write_new_file(path, data):
+            return 0
+        self.unique_crashes += 1
+        self.log('new crash: {0}'.format(path))
+        traceback.print_exception(tp, value, tb)
+        return 0
+
+    cdef int add_to_corpus(self, bytes data, bint save) except -1:
+        self.corpus += [data]
+        while save:
+            name = 'w{0}-{1:06d}'.format(self.worker, self.queued)
+            self.queued += 1
+            save = not write_new_file(os.path.join(self.queue_dir, name), data)
+            self.synced.add(name)
+        return 0
+
+    cdef int sync(self) except -1:
+        # pick up inputs found by other workers (or by the previous runs)
+        cdef int result
+        for name in sorted(os.listdir(self.queue_dir)):
+            if name.startswith('.') or name in self.synced:
+                continue
+            self.synced.add(name)
+            data = read_input_file(os.path.join(self.queue_dir, name))
+            result = self.execute(data)
+            if result == NEW_HIT_COUNTS or result == NEW_EDGES:
+                self.add_to_corpus(data, save=False)
+        self.last_sync = time.time()
+        return 0
+
+    # Mutators work in place on self.buf, which has room for max_len bytes.
+
+    cdef size_t mutate_byte(self, size_t n):
+        # a single small change
+        cdef size_t pos
+        cdef int op = rand_below(&self.rng, 4)
+        if n == 0:
+            self.buf[0] = rand_below(&self.rng, 256)
+            return 1
+        pos = rand_below(&self.rng, n)
+        if op == 0:
+            self.buf[pos] ^= 1 << rand_below(&self.rng, 8)
+        elif op == 1:
+            self.buf[pos] = interesting_8[rand_below(&self.rng, 9)]
+        elif op == 2:
+            self.buf[pos] ^= 1 + rand_below(&self.rng, 255)
+        elif rand_below(&self.rng, 2):
+            self.buf[pos] += 1 + rand_below(&self.rng, MAX_ARITH)
+        else:
+            self.buf[pos] -= 1 + rand_below(&self.rng, MAX_ARITH)
+        return n
+
+    cdef size_t mutate_havoc(self, size_t n):
+        # a stack of random changes, some of which change the size
+        cdef int i, op
+        cdef int stack = 1 << (1 + rand_below(&self.rng, 5))
+        cdef size_t pos, src, block
+        cdef uint16_t word
+        cdef uint32_t dword
+        cdef unsigned char tmp[MAX_BLOCK_LEN]
+        for i in range(stack):
+            op = rand_below(&self.rng, 8)
+            if op == 0 or (n < 4 and op < 4):
+                n = self.mutate_byte(n)
+            elif op == 1:
+                word = <uint16_t> interesting_16[rand_below(&self.rng, 10)]
+                if rand_below(&self.rng, 2):
+                    word = (word >> 8) | (word << 8)
+                memcpy(self.buf + rand_below(&self.rng, n - 1), &word, 2)
+            elif op == 2:
+                dword = <uint32_t> interesting_32[rand_below(&self.rng, 8)]
+                memcpy(self.buf + rand_below(&self.rng, n - 3), &dword, 4)
+            elif op == 3:
+                # arithmetic on a 16-bit word
+                pos = rand_below(&self.rng, n - 1)
+                memcpy(&word, self.buf + pos, 2)
+                if rand_below(&self.rng, 2):
+                    word += 1 + rand_below(&self.rng, MAX_ARITH)
+                else:
+                    word -= 1 + rand_below(&self.rng, MAX_ARITH)
+                memcpy(self.buf + pos, &word, 2)
+            elif op == 4:
+                # delete a block
+                if n < 2:
+                    continue
+                block = 1 + rand_below(&self.rng, min(n - 1, <size_t> MAX_BLOCK_LEN))
+                pos = rand_below(&self.rng, n - block + 1)
+                memmove(self.buf + pos, self.buf + pos + block, n - pos - block)
+                n -= block
+            elif op == 5 or op == 6:
+                # insert a block: either a copy of another part of the input,
+                # or a repeated byte
+                if n >= self.max_len:
+                    continue
+                block = 1 + rand_below(&self.rng, min(self.max_len - n, <size_t> MAX_BLOCK_LEN))
+                if op == 5 and block <= n:
+                    src = rand_below(&self.rng, n - block + 1)
+                    memcpy(tmp, self.buf + src, block)
+                else:
+                    memset(tmp, rand_below(&self.rng, 256), block)
+                pos = rand_below(&self.rng, n + 1)
+                memmove(self.buf + pos + block, self.buf + pos, n - pos)
+                memcpy(self.buf + pos, tmp, block)
+                n += block
+            else:
+                # overwrite a block with another part of the input
+                if n < 2:
+                    continue
+                block = 1 + rand_below(&self.rng, min(n // 2, <size_t> MAX_BLOCK_LEN))
+                src = rand_below(&self.rng, n - block + 1)
+                pos = rand_below(&self.rng, n - block + 1)
+                memmove(self.buf + pos, self.buf + src, block)
+        return n
+
+    cdef size_t load(self, bytes data):
+        cdef size_t n = min(<size_t> len(data), self.max_len)
+        memcpy(self.buf, <char *> data, n)
+        return n
+
+    cdef size_t splice(self, size_t n):
+        # replace the tail of the input with the tail of another corpus entry
+        cdef bytes other = self.corpus[rand_below(&self.rng, len(self.corpus))]
+        cdef size_t m = min(<size_t> len(other), self.max_len)
+        cdef size_t split
+        if n < 2 or m < 2:
+            return n
+        split = 1 + rand_below(&self.rng, min(n, m) - 1)
+        memcpy(self.buf + split, (<char *> other) + split, m - split)
+        return m
+
+    cdef bytes mutate(self):
+        cdef size_t n = self.load(self.corpus[rand_below(&self.rng, len(self.corpus))])
+        cdef int strategy = rand_below(&self.rng, 8)
+        if strategy == 0 and len(self.corpus) > 1:
+            n = self.mutate_havoc(self.splice(n))
+        elif strategy < 4:
+            n = self.mutate_byte(n)
+        else:
+            n = self.mutate_havoc(n)
+        return (<char *> self.buf)[:n]
+
+    cdef int run(self, list seeds, unsigned long max_execs) except -1:
+        cdef int result
+        try:
+            for data in seeds:
+                if self.execute(data) != CRASHED:
+                    self.add_to_corpus(data, save=False)
+            self.sync()
+            if not self.corpus:
+                self.add_to_corpus(b'', save=False)
+            while max_execs == 0 or self.execs < max_execs:
+                data = self.mutate()
+                result = self.execute(data)
+                if result == NEW_HIT_COUNTS or result == NEW_EDGES:
+                    self.add_to_corpus(data, save=True)
+                if self.execs & 0xFF == 0:
+                    now = time.time()
+                    if now - self.last_sync >= 1:
+                        self.sync()
+                    if now - self.last_report >= 5:
+                        self.report()
+        finally:
+            self.report()
+        return 0
+
+cdef int run_engine_worker(
+    test_one_input, bint bytes_input, output_dir, int worker, uint64_t seed, list seeds,
+) except -1:
+    global afl_area
+    cdef Engine engine = Engine(
+        test_one_input, bytes_input, output_dir, worker, seed,
+        int(os.getenv('PYTHON_AFL_ENGINE_MAX_LEN') or 4096),
+    )
+    afl_area = <unsigned char *> calloc(map_size, 1)
+    if afl_area == NULL:
+        raise MemoryError
+    start_tracing()
+    try:
+        engine.run(seeds, int(os.getenv('PYTHON_AFL_ENGINE_RUNS') or 0))
+    finally:
+        stop_tracing()
+    return 0
+
+cdef int run_engine(test_one_input, bint bytes_input) except -1:
+    output_dir = os.getenv('PYTHON_AFL_ENGINE')
+    jobs = int(os.getenv('PYTHON_AFL_ENGINE_JOBS') or 1)
+    if jobs < 1:
+        raise RuntimeError('invalid PYTHON_AFL_ENGINE_JOBS: {0}'.format(jobs))
+    seed = int(os.getenv('PYTHON_AFL_ENGINE_SEED') or 0)
+    if seed == 0:
+        seed = struct.unpack('Q', os.urandom(8))[0]
+    for subdir in ['queue', 'crashes']:
+        make_dirs(os.path.join(output_dir, subdir))
+    seeds = read_seeds(os.getenv('PYTHON_AFL_ENGINE_INPUT'))
+    configure_instrumentation(None, None, None)
+    configure_tracing()
+    if jobs == 1:
+        run_engine_worker(test_one_input, bytes_input, output_dir, 0, seed, seeds)
+        return 0
+    pids = []
+    for worker in range(jobs):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_engine_worker(test_one_input, bytes_input, output_dir, worker, seed, seeds)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:  # pylint: disable=broad-except
+                traceback.print_exc()
+                status = 1
+            sys.stderr.flush()
+            _exit(status)
+        pids += [pid]
+    failed = 0
+    for pid in pids:
+        while True:
+            try:
+                (_, status) = os.waitpid(pid, 0)
+            except KeyboardInterrupt:
+                # the workers got SIGINT too; wait for them to finish
+                continue
+            break
+        if status != 0:
+            failed += 1
+    if failed:
+        raise RuntimeError('{0} of {1} engine workers failed'.format(failed, jobs))
+    return 0
+
+# Fork server client:
+# Driver runs a program the way afl-fuzz does,
+# so that many inputs can be run through a single warm interpreter.
+
+cdef extern from 'poll.h':
+    struct pollfd:
+        int fd
+        short events
+        short revents
+    int poll(pollfd *fds, unsigned long nfds, int timeout) nogil
+    enum:
+        POLLIN
+
+# The round trip runs without the GIL,
+# so that threads can drive several programs at once.
+# These functions return 0 on success, -1 on error (with errno set),
+# and 1 on EOF.
+
+cdef int read_all_nogil(int fd, void *buf, size_t size) nogil:
+    cdef ssize_t n
+    cdef char *p = <char *> buf
+    while size > 0:
+        n = read(fd, p, size)
+        if n < 0:
+            if errno.errno == errno.EINTR:
+                continue
+            return -1
+        if n == 0:
+            return 1
+        p += n
+        size -= n
+    return 0
+
+cdef int write_all_nogil(int fd, const void *buf, size_t size) nogil:
+    cdef ssize_t n
+    cdef const char *p = <const char *> buf
+    while size > 0:
+        n = write(fd, p, size)
+        if n < 0:
+            if errno.errno == errno.EINTR:
+                continue
+            return -1
+        p += n
+        size -= n
+    return 0
+
+cdef int roundtrip(int ctl_fd, int st_fd, int timeout, pid_t *pid, int *status, bint *timed_out) nogil:
+    # timeout is in milliseconds; negative means no timeout
+    cdef uint32_t msg = 0
+    cdef pollfd pfd
+    cdef int rc
+    rc = write_all_nogil(ctl_fd, &msg, 4)
+    if rc == 0:
+        rc = read_all_nogil(st_fd, &msg, 4)
+    if rc != 0:
+        return rc
+    pid[0] = <pid_t> msg
+    pfd.fd = st_fd
+    pfd.events = POLLIN
+    while True:
+        rc = poll(&pfd, 1, timeout)
+        if rc >= 0:
+            break
+        if errno.errno != errno.EINTR:
+            return -1
+    if rc == 0:
+        kill(pid[0], SIGKILL)
+        timed_out[0] = True
+    rc = read_all_nogil(st_fd, &msg, 4)
+    status[0] = <int> msg
+    return rc
+
+cdef pid_t spawn_fork_server(argv, env, int ctl_fd, int st_fd, int input_fd, int crash_fd, bint quiet) except -1:
+    # posix_spawn() is safe to use in multi-threaded programs,
+    # and it doesn't need to copy the page tables of a big process
+    if hasattr(os, 'posix_spawnp'):
+        # Python >= 3.8
+        file_actions = [
+            (os.POSIX_SPAWN_DUP2, ctl_fd, FORKSRV_FD),
+            (os.POSIX_SPAWN_DUP2, st_fd, FORKSRV_FD + 1),
+            (os.POSIX_SPAWN_DUP2, input_fd, 0),
+            (os.POSIX_SPAWN_DUP2, crash_fd, FORKSRV_FD - 1),
+        ]
+        if quiet:
+            file_actions += [
+                (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_DUP2, 1, 2),
+            ]
+        return os.posix_spawnp(argv[0], argv, env, file_actions=file_actions)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(ctl_fd, FORKSRV_FD)
+            os.dup2(st_fd, FORKSRV_FD + 1)
+            os.dup2(input_fd, 0)
+            os.dup2(crash_fd, FORKSRV_FD - 1)
+            if quiet:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+                os.dup2(devnull, 2)
+            os.execvpe(argv[0], argv, env)
+        except BaseException as exc:  # pylint: disable=broad-except
+            os.write(2, '{0}: {1}\n'.format(argv[0], exc).encode('UTF-8', 'replace'))
+        _exit(127)
+    return pid
+
+cdef class Driver:
+    '''
+    Driver(argv, env=None, map_size=None, timeout=None, quiet=False)
+
+    Start the program in argv under the fork server protocol,
+    with the persistent mode enabled,
+    the way afl-fuzz does, but without AFL.
+
+    The input is passed on stdin,
+    or in the file whose name replaces @@ in argv.
+    timeout is in milliseconds.
+    If quiet is true, the program's stdout and stderr are discarded.
+
+    The number of runs and the total time they took
+    are available as the execs and exec_time attributes.
+    '''
+
+    cdef readonly object argv
+    cdef readonly unsigned int map_size
+    cdef readonly bint timed_out
+    cdef readonly object crash_signature
+    cdef readonly unsigned long long execs
+    cdef readonly double exec_time
+    cdef int timeout
+    cdef int shm_id
+    cdef unsigned char *area
+    cdef int ctl_fd
+    cdef int st_fd
+    cdef int input_fd
+    cdef int crash_fd
+    cdef object input_path
+    cdef pid_t server_pid
+    cdef pid_t child_pid
+    cdef bint child_stopped
+
+    def __cinit__(self):
+        self.shm_id = -1
+        self.ctl_fd = self.st_fd = self.input_fd = self.crash_fd = -1
+
+    def __init__(self, argv, env=None, map_size=None, timeout=None, quiet=False):
+        import tempfile
+        self.argv = list(argv)
+        self.map_size = int(map_size or os.getenv('AFL_MAP_SIZE') or MAP_SIZE)
+        if not 1 < self.map_size <= FS_OPT_MAX_MAPSIZE:
+            raise ValueError('invalid map size: {0}'.format(self.map_size))
+        self.timeout = -1 if timeout is None else int(timeout)
+        self.shm_id = shmget(IPC_PRIVATE, self.map_size, IPC_CREAT | IPC_EXCL | 0o600)
+        if self.shm_id < 0:
+            PyErr_SetFromErrno(OSError)
+        self.area = shm_attach(self.shm_id)
+        (fd, path) = tempfile.mkstemp(prefix='python-afl.')
+        self.input_fd = fd
+        if any('@@' in arg for arg in self.argv):
+            # the program reads the input from the file named on the command line
+            self.input_path = path
+            self.argv = [arg.replace('@@', path) for arg in self.argv]
+        else:
+            os.unlink(path)
+        child_env = dict(os.environ)
+        child_env.update(env or ())
+        child_env.pop(SHM_FUZZ_ENV_VAR.decode('ASCII'), None)
+        child_env[SHM_ENV_VAR.decode('ASCII')] = str(self.shm_id)
+        child_env['AFL_MAP_SIZE'] = str(self.map_size)
+        child_env['PYTHON_AFL_PERSISTENT'] = '1'
+        child_env['PYTHON_AFL_SIGNAL'] = child_env.get('PYTHON_AFL_SIGNAL') or 'SIGUSR1'
+        child_env['PYTHON_AFL_CRASH_FD'] = str(FORKSRV_FD - 1)
+        # All the ends are close-on-exec (even on Python 2),
+        # so that the fork server gets only the ones duplicated for it,
+        # and sees EOF on the control pipe when the driver is closed.
+        cdef int ctl_fds[2]
+        cdef int st_fds[2]
+        cdef int crash_fds[2]
+        make_pipe(ctl_fds)
+        make_pipe(st_fds)
+        make_pipe(crash_fds)
+        self.ctl_fd = ctl_fds[1]
+        self.st_fd = st_fds[0]
+        self.crash_fd = crash_fds[0]
+        fcntl(self.crash_fd, F_SETFL, O_NONBLOCK)
+        try:
+            self.server_pid = spawn_fork_server(
+                self.argv, child_env, ctl_fds[0], st_fds[1], self.input_fd, crash_fds[1], quiet
+            )
+        except OSError:
+            self.close()
+            raise
+        finally:
+            close(ctl_fds[0])
+            close(st_fds[1])
+            close(crash_fds[1])
+        cdef uint32_t hello
+        try:
+            read_all(self.st_fd, &hello, 4)
+        except EOFError:
+            self.close()
+            raise RuntimeError('fork server handshake failed')
+        if hello & FS_OPT_ENABLED == FS_OPT_ENABLED and hello & FS_OPT_MAPSIZE:
+            size = ((hello >> 1) & (FS_OPT_MAX_MAPSIZE - 1)) + 1
+            if size > self.map_size:
+                self.close()
+                raise RuntimeError(
+                    'target map size is larger than the shared memory segment: {0} > {1}'.format(
+                        size, self.map_size
+                    )
+                )
+
+    def __dealloc__(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def run(self, bytes data):
+        '''
+        run(data) -> status
+
+        Run the program with data as the input.
+        Return the exit status, as returned by os.waitpid().
+        A persistent-mode iteration that has finished normally
+        (that is, the program stopped itself with SIGSTOP) counts as 0;
+        the stopped process is resumed for the next input.
+        If the program timed out, it is killed,
+        and the timed_out attribute is set.
+        '''
+        cdef int status = 0
+        cdef int rc
+        cdef bint timed_out = False
+        if self.server_pid <= 0:
+            raise ValueError('driver is closed')
+        start = time.time()
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+        os.ftruncate(self.input_fd, 0)
+        write_all(self.input_fd, <const char *> data, len(data))
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+        memset(self.area, 0, self.map_size)
+        with nogil:
+            rc = roundtrip(self.ctl_fd, self.st_fd, self.timeout, &self.child_pid, &status, &timed_out)
+        self.timed_out = timed_out
+        if rc < 0:
+            PyErr_SetFromErrno(OSError)
+        if rc > 0:
+            raise RuntimeError('fork server died')
+        self.execs += 1
+        self.exec_time += time.time() - start
+        self.crash_signature = None
+        if WIFSIGNALED(status) and not timed_out:
+            self.crash_signature = self.read_crash_signature()
+        self.child_stopped = WIFSTOPPED(status)
+        if self.child_stopped:
+            return 0
+        return status
+
+    def run_many(self, inputs, bint classify=True):
+        '''
+        run_many(inputs, classify=True) -> iterator of (status, map)
+
+        Run the program on every input in turn.
+        Yield the exit status (see run())
+        and the coverage map (see trace_bits()) for each of them.
+        '''
+        for data in inputs:
+            status = self.run(data)
+            yield (status, self.trace_bits(classify))
+
+    @property
+    def execs_per_second(self):
+        '''
+        The average number of runs per second.
+        '''
+        if self.exec_time <= 0:
+            return 0.0
+        return self.execs / self.exec_time
+
+    cdef object read_crash_signature(self):
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.crash_fd, 4096)
+            except OSError as exc:
+                if exc.errno == errno.EAGAIN:
+                    break
+                raise
+            if not chunk:
+                break
+            data += chunk
+        lines = data.splitlines()
+        if not lines:
+            return None
+        return lines[-1].decode('UTF-8', 'replace')
+
+    def trace_bits(self, bint classify=True):
+        '''
+        trace_bits(classify=True) -> bytes
+
+        Return the coverage map of the last run.
+        If classify is true, the hit counts are put into buckets,
+        like afl-fuzz does.
+        '''
+        cdef size_t i
+        cdef bytes result = (<char *> self.area)[:self.map_size]
+        cdef unsigned char *p
+        if classify:
+            p = <unsigned char *> (<char *> result)
+            for i in range(self.map_size):
+                p[i] = count_class[p[i]]
+        return result
+
+    def tuples(self, bint classify=True):
+        '''
+        tuples(classify=True) -> [(index, count), ...]
+
+        Return the non-zero entries of the coverage map of the last run.
+        '''
+        cdef size_t i
+        result = []
+        for i in range(self.map_size):
+            if self.area[i]:
+                result += [(i, count_class[self.area[i]] if classify else self.area[i])]
+        return result
+
+    def close(self):
+        '''
+        Stop the program and free the resources.
+        '''
+        self._close()
+
+    cdef int _close(self) except -1:
+        cdef int status
+        if self.child_stopped:
+            kill(self.child_pid, SIGKILL)
+            self.child_stopped = False
+        if self.server_pid > 0:
+            # The fork server exits cleanly (e.g. after dumping statistics)
+            # when it sees EOF on the control pipe;
+            # it's killed only if it hangs.
+            close(self.ctl_fd)
+            self.ctl_fd = -1
+            deadline = time.time() + 1
+            while wait_for(self.server_pid, &status, WNOHANG) == 0:
+                if time.time() > deadline:
+                    kill(self.server_pid, SIGKILL)
+                    wait_for(self.server_pid, &status, 0)
+                    break
+                time.sleep(0.001)
+            self.server_pid = 0
+        for fd in (self.ctl_fd, self.st_fd, self.input_fd, self.crash_fd):
+            if fd >= 0:
+                close(fd)
+        self.ctl_fd = self.st_fd = self.input_fd = self.crash_fd = -1
+        if self.input_path is not None:
+            os.unlink(self.input_path)
+            self.input_path = None
+        if self.area != NULL:
+            shmdt(self.area)
+            self.area = NULL
+        if self.shm_id >= 0:
+            shmctl(self.shm_id, IPC_RMID, NULL)
+            self.shm_id = -1
+        return 0
+
 __all__ = [
+    'Driver',
+    'fuzz',
     'init',
+    'install_import_hook',
     'loop',
+    'run_async',
+    'testcase',
 ]
 
+if os.getenv('PYTHON_AFL_IMPORT_HOOK') is not None:
+    install_import_hook()
+
 # vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,49 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# This module uses syntax that is not available in Python 2.
+
+import asyncio
+
+async def count_up(n):
+    for _ in range(n):
+        await asyncio.sleep(0)
+        n += 1
+    return n
+
+async def count_down(n):
+    for _ in range(n):
+        n -= 1
+        await asyncio.sleep(0)
+    return n
+
+async def gather(coroutine_functions):
+    await asyncio.gather(*[f(3) for f in coroutine_functions])
+
+def log_event_loop(path):
+    async def iteration():
+        await asyncio.sleep(0)
+        with open(path, 'ab') as file:
+            file.write('{0}\n'.format(id(asyncio.get_running_loop())).encode('ASCII'))
+    return iteration
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,42 @@
+# encoding=UTF-8
+
+# Copyright © 2015-2018 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+
+import afl
+
+def test_one_input(s):
+    if not s:
+        print('Hum?')
+        sys.exit(1)
+    s.encode('ASCII')
+    if s[0] == '0':
+        print('Looks like a zero to me!')
+    else:
+        print('A non-zero value? How quaint!')
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    ''.encode('ASCII')  # make sure the codec module is loaded before the loop
+    afl.fuzz(test_one_input, bytes_input=False)
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,87 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+
+import afl
+
+from .tools import (
+    SkipTest,
+    assert_equal,
+    assert_true,
+    fork_server,
+    tempdir,
+    traced_map,
+)
+
+def require_asyncio():
+    if sys.version_info < (3, 7):
+        raise SkipTest('Python >= 3.7 is required')
+
+def tracers():
+    yield 'settrace'
+    yield 'ctrace'
+    if hasattr(sys, 'monitoring'):
+        yield 'monitoring'
+
+def nonzero(area):
+    return {i: n for (i, n) in enumerate(bytearray(area)) if n}
+
+def test_task_interleaving():
+    require_asyncio()
+    import asyncio  # pylint: disable=import-outside-toplevel
+    from . import async_tools  # pylint: disable=import-outside-toplevel
+    def target(order):
+        return lambda: asyncio.run(async_tools.gather(order))
+    for tracer in tracers():
+        env = dict(PYTHON_AFL_TRACER=tracer)
+        [map1, map2] = [
+            nonzero(traced_map(target(order), env, include=[async_tools.__name__]))
+            for order in [
+                (async_tools.count_up, async_tools.count_down),
+                (async_tools.count_down, async_tools.count_up),
+            ]
+        ]
+        assert_equal(map1, map2)
+
+def test_run_async():
+    require_asyncio()
+    from . import async_tools  # pylint: disable=import-outside-toplevel
+    with tempdir() as tmpdir:
+        log_path = os.path.join(tmpdir, 'log')
+        def target():
+            afl.run_async(async_tools.log_event_loop(log_path), 3)
+        env = dict(PYTHON_AFL_PERSISTENT='1')
+        with fork_server(target, env) as server:
+            server.read()
+            for _ in range(2):
+                (_, status) = server.run()
+                assert_true(os.WIFSTOPPED(status))
+            (_, status) = server.run()
+            assert_equal(status, 0)
+        with open(log_path, 'rb') as file:
+            loop_ids = file.read().splitlines()
+    assert_equal(len(loop_ids), 3)
+    assert_equal(len(set(loop_ids)), 1)
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,147 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import signal
+import struct
+import subprocess as ipc
+import sys
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_true,
+    fork_server,
+    shared_map,
+    tempdir,
+)
+
+here = os.path.dirname(__file__)
+target = here + '/target_callback.py'
+
+def run_target(args, stdin=b'', env=()):
+    env = dict(os.environ, **dict(env))
+    child = ipc.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, target] + list(args),
+        stdin=ipc.PIPE,
+        stdout=ipc.PIPE,
+        stderr=ipc.PIPE,
+        env=env,
+    )
+    (stdout, _) = child.communicate(stdin)
+    return (child.returncode, stdout.decode('ASCII').splitlines())
+
+def test_replay_files():
+    with tempdir() as tmpdir:
+        paths = []
+        for data in ['0', '1']:
+            path = os.path.join(tmpdir, data)
+            with open(path, 'wb') as file:
+                file.write(data.encode('ASCII'))
+            paths += [path]
+        (status, output) = run_target(paths)
+    assert_equal(status, 0)
+    assert_equal(output, [
+        'Looks like a zero to me!',
+        'A non-zero value? How quaint!',
+    ])
+
+def test_replay_stdin():
+    (status, output) = run_target([], stdin=b'0')
+    assert_equal(status, 0)
+    assert_equal(output, ['Looks like a zero to me!'])
+
+def test_replay_exception():
+    (status, _) = run_target([], stdin=b'\xFF')
+    assert_equal(status, 1)
+    (status, _) = run_target([], stdin=b'\xFF', env=dict(PYTHON_AFL_SIGNAL='SIGUSR1'))
+    assert_equal(status, -signal.SIGUSR1)
+
+def _test_fuzz(inputs, put_input, env=(), args=(), stdin=None):
+    # run afl.fuzz() in persistent mode under a fake fuzzer;
+    # return the list of inputs it has seen
+    with tempdir() as tmpdir:
+        log_path = os.path.join(tmpdir, 'log')
+        def test_one_input(data):
+            with open(log_path, 'ab') as file:
+                file.write(repr(data).encode('ASCII') + b'\n')
+        def fuzz():
+            sys.argv[1:] = args
+            if stdin is not None:
+                os.dup2(stdin.fileno(), 0)
+            afl.fuzz(test_one_input, len(inputs))
+        env = dict(env, PYTHON_AFL_PERSISTENT='1')
+        with fork_server(fuzz, env) as server:
+            hello = server.read()
+            if hello & FS_OPT_SHDMEM_FUZZ:
+                server.write(FS_OPT_ENABLED | FS_OPT_SHDMEM_FUZZ)
+            for (i, data) in enumerate(inputs):
+                put_input(data)
+                (_, status) = server.run()
+                if i < len(inputs) - 1:
+                    assert_true(os.WIFSTOPPED(status))
+                else:
+                    assert_equal(status, 0)
+        with open(log_path, 'rb') as file:
+            return file.read().splitlines()
+
+FS_OPT_ENABLED = 0x80000001
+FS_OPT_SHDMEM_FUZZ = 0x01000000
+
+fuzz_inputs = [b'foo', b'', b'\xFF' * 100000, b'bar']
+
+def xoutput():
+    return [repr(data).encode('ASCII') for data in fuzz_inputs]
+
+def test_fuzz_file():
+    with tempdir() as tmpdir:
+        path = os.path.join(tmpdir, 'input')
+        def put_input(data):
+            if os.path.exists(path):
+                os.unlink(path)
+            with open(path, 'wb') as file:
+                file.write(data)
+        output = _test_fuzz(fuzz_inputs, put_input, args=[path])
+    assert_equal(output, xoutput())
+
+def test_fuzz_stdin():
+    with tempdir() as tmpdir:
+        path = os.path.join(tmpdir, 'input')
+        with open(path, 'w+b') as file:
+            def put_input(data):
+                file.seek(0)
+                file.truncate()
+                file.write(data)
+                file.flush()
+            output = _test_fuzz(fuzz_inputs, put_input, stdin=file)
+    assert_equal(output, xoutput())
+
+def test_fuzz_shared_memory():
+    with shared_map(1 << 20, env_var='__AFL_SHM_FUZZ_ID') as area:
+        def put_input(data):
+            header = struct.pack('I', len(data))
+            area[:len(header) + len(data)] = bytearray(header + data)
+        output = _test_fuzz(fuzz_inputs, put_input)
+    assert_equal(output, xoutput())
+
+# vim:ts=4 sts=4 sw=4 et
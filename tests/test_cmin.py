@@ -25,7 +25,7 @@ import sys
 
 from .tools import (
     assert_equal,
-    require_commands,
+    python_command,
     run,
     tempdir,
 )
@@ -34,7 +34,6 @@ here = os.path.dirname(__file__)
 target = here + '/target.py'
 
 def run_afl_cmin(input, xoutput, crashes_only=False):
-    require_commands('py-afl-cmin', 'afl-cmin')
     input = sorted(input)
     xoutput = sorted(xoutput)
     with tempdir() as workdir:
@@ -46,9 +45,9 @@ def run_afl_cmin(input, xoutput, crashes_only=False):
             path = '{dir}/{n}'.format(dir=indir, n=n)
             with open(path, 'wb') as file:
                 file.write(blob)
-        cmdline = ['py-afl-cmin', '-i', indir, '-o', outdir, '--', sys.executable, target]
+        cmdline = python_command('py-afl-cmin') + ['-i', indir, '-o', outdir, '--', sys.executable, target]
         if crashes_only:
-            cmdline[1:1] = ['-C']
+            cmdline[2:2] = ['-C']
         run(cmdline)
         output = []
         for n in os.listdir(outdir):
@@ -0,0 +1,149 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import functools
+import os
+import sys
+
+import afl
+
+from .tools import (
+    SkipTest,
+    assert_equal,
+    assert_not_equal,
+    assert_raises_regex,
+    assert_true,
+    fork_isolation,
+    shared_map,
+    traced_map,
+)
+
+def tracers():
+    if sys.version_info < (3, 7):
+        raise SkipTest('Python >= 3.7 is required')
+    yield 'settrace'
+    yield 'ctrace'
+    if hasattr(sys, 'monitoring'):
+        yield 'monitoring'
+
+def ternary(x):
+    return 'a' if x else 'b'
+
+def parse_int(s):
+    try:
+        return int(s)
+    except ValueError:
+        return None
+
+def nest(depth):
+    if depth > 0:
+        nest(depth - 1)
+
+def sequence(s):
+    n = 0
+    for c in s:
+        if c == 'a':
+            n += 1
+        else:
+            n -= 1
+    return n
+
+def get_map(f, arg, tracer, coverage):
+    env = dict(
+        PYTHON_AFL_TRACER=tracer,
+        PYTHON_AFL_COVERAGE=coverage,
+    )
+    area = traced_map(functools.partial(f, arg), env)
+    return dict(
+        (i, n) for (i, n) in enumerate(bytearray(area)) if n
+    )
+
+def test_line():
+    for tracer in tracers():
+        map1 = get_map(ternary, True, tracer, 'line')
+        map2 = get_map(ternary, False, tracer, 'line')
+        assert_true(map1)
+        assert_equal(map1, map2)
+
+def test_branch():
+    for tracer in tracers():
+        map1 = get_map(ternary, True, tracer, 'branch')
+        map2 = get_map(ternary, False, tracer, 'branch')
+        assert_true(map1)
+        assert_not_equal(map1, map2)
+        assert_equal(get_map(ternary, True, tracer, 'branch'), map1)
+
+def test_branch_counts():
+    for tracer in tracers():
+        # the same edges, taken a different number of times:
+        map1 = get_map(sequence, 'aa', tracer, 'branch')
+        map2 = get_map(sequence, 'aaaa', tracer, 'branch')
+        assert_equal(set(map1), set(map2))
+        assert_not_equal(map1, map2)
+
+def test_branch_exception():
+    for tracer in tracers():
+        map1 = get_map(parse_int, '42', tracer, 'branch')
+        map2 = get_map(parse_int, 'eggs', tracer, 'branch')
+        assert_not_equal(map1, map2)
+
+def test_ctx():
+    for tracer in tracers():
+        # nesting depth is invisible to the plain edge coverage…
+        map1 = get_map(nest, 3, tracer, 'line')
+        map2 = get_map(nest, 4, tracer, 'line')
+        assert_equal(set(map1), set(map2))
+        # … but not to the context-sensitive one
+        map1 = get_map(nest, 3, tracer, 'ctx')
+        map2 = get_map(nest, 4, tracer, 'ctx')
+        assert_not_equal(set(map1), set(map2))
+        assert_equal(get_map(nest, 3, tracer, 'ctx'), map1)
+
+def test_ngram():
+    for tracer in tracers():
+        # the same edges in a different order:
+        map1 = get_map(sequence, 'ab', tracer, 'line')
+        map2 = get_map(sequence, 'ba', tracer, 'line')
+        assert_equal(set(map1), set(map2))
+        map1 = get_map(sequence, 'ab', tracer, 'ngram-3')
+        map2 = get_map(sequence, 'ba', tracer, 'ngram-3')
+        assert_not_equal(set(map1), set(map2))
+        assert_equal(get_map(sequence, 'ab', tracer, 'ngram-3'), map1)
+        # 2-grams are just edges:
+        map1 = get_map(sequence, 'ab', tracer, 'line')
+        assert_equal(get_map(sequence, 'ab', tracer, 'ngram-2'), map1)
+
+@fork_isolation
+def test_unknown_coverage():
+    os.environ['PYTHON_AFL_COVERAGE'] = 'eggs'
+    with shared_map():
+        with assert_raises_regex(RuntimeError, "^unknown PYTHON_AFL_COVERAGE: 'eggs'$"):
+            afl.init()
+
+@fork_isolation
+def test_invalid_ngram_size():
+    os.environ['PYTHON_AFL_COVERAGE'] = 'ngram-42'
+    with shared_map():
+        with assert_raises_regex(RuntimeError, "^unknown PYTHON_AFL_COVERAGE: 'ngram-42'$"):
+            afl.init()
+
+# vim:ts=4 sts=4 sw=4 et
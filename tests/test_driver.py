@@ -0,0 +1,119 @@
+# encoding=UTF-8
+
+# Copyright © 2015-2021 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import signal
+import sys
+import time
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_not_equal,
+    assert_raises,
+    assert_true,
+    tempdir,
+)
+
+here = os.path.dirname(__file__)
+target = here + '/target.py'
+
+def _test_run(script):
+    with afl.Driver([sys.executable, script], quiet=True) as driver:
+        # in persistent mode, the first iteration has extra coverage:
+        assert_equal(driver.run(b'0'), 0)
+        assert_equal(driver.run(b'0'), 0)
+        map0 = driver.trace_bits()
+        assert_equal(len(map0), driver.map_size)
+        assert_not_equal(map0.strip(b'\0'), b'')
+        assert_equal(driver.run(b'00'), 0)
+        assert_equal(driver.trace_bits(), map0)
+        assert_equal(driver.run(b'1'), 0)
+        assert_not_equal(driver.trace_bits(), map0)
+        status = driver.run(b'\xFF')
+        assert_true(os.WIFSIGNALED(status))
+        assert_equal(os.WTERMSIG(status), signal.SIGUSR1)
+        (exc, location) = driver.crash_signature.split(' ')
+        assert_true(exc.endswith('Error'))
+        assert_true(location.startswith(script + ':'))
+        assert_equal(driver.run(b'0'), 0)
+        assert_equal(driver.crash_signature, None)
+        assert_equal(driver.run(b'0'), 0)
+        assert_equal(driver.trace_bits(), map0)
+        assert_equal(driver.execs, 7)
+        assert_true(driver.exec_time > 0)
+        assert_true(driver.execs_per_second > 0)
+
+def test_run():
+    _test_run(target)
+
+def test_run_persistent():
+    _test_run(here + '/target_persistent.py')
+
+def test_run_many():
+    inputs = [b'0', b'1', b'0', b'']
+    with afl.Driver([sys.executable, here + '/target_callback.py', '@@'], quiet=True) as driver:
+        results = list(driver.run_many(inputs))
+    assert_equal([status for (status, bits) in results], [0, 0, 0, 1 << 8])
+    assert_equal(results[0][1], results[2][1])
+    assert_not_equal(results[0][1], results[1][1])
+
+def test_timeout():
+    code = 'import afl, time\nwhile afl.loop():\n    time.sleep(10)'
+    with afl.Driver([sys.executable, '-c', code], timeout=100) as driver:
+        status = driver.run(b'')
+        assert_true(driver.timed_out)
+        assert_true(os.WIFSIGNALED(status))
+        assert_equal(os.WTERMSIG(status), signal.SIGKILL)
+        driver.run(b'')
+        assert_true(driver.timed_out)
+
+def test_child_fds():
+    # the fork server pipes must not leak into the children
+    code = (
+        'import afl, os, sys\n'
+        'afl.init()\n'
+        'sys.exit(len([fd for fd in (198, 199) if os.path.exists("/proc/self/fd/%d" % fd)]))'
+    )
+    with afl.Driver([sys.executable, '-c', code]) as driver:
+        assert_equal(driver.run(b''), 0)
+
+def test_close():
+    driver = afl.Driver([sys.executable, target], quiet=True)
+    driver.close()
+    with assert_raises(ValueError):
+        driver.run(b'0')
+
+def test_clean_close():
+    # the fork server exits as soon as it sees EOF on the control pipe
+    with tempdir() as workdir:
+        stats_path = workdir + '/stats.json'
+        driver = afl.Driver([sys.executable, target], env=dict(PYTHON_AFL_STATS=stats_path), quiet=True)
+        driver.run(b'0')
+        start = time.time()
+        driver.close()
+        assert_true(time.time() - start < 0.5)
+        # it wasn't killed, so it had a chance to dump the statistics
+        assert_true(os.path.exists(stats_path))
+
+# vim:ts=4 sts=4 sw=4 et
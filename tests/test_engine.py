@@ -0,0 +1,104 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import subprocess as ipc
+import sys
+
+from .tools import (
+    assert_equal,
+    assert_in,
+    assert_true,
+    tempdir,
+)
+
+here = os.path.dirname(__file__)
+target = here + '/target_engine.py'
+
+def run_engine(tmpdir, seeds=(), queue=(), runs=1000, jobs=1):
+    input_dir = os.path.join(tmpdir, 'input')
+    output_dir = os.path.join(tmpdir, 'output')
+    os.mkdir(input_dir)
+    for (i, data) in enumerate(seeds):
+        with open(os.path.join(input_dir, str(i)), 'wb') as file:
+            file.write(data)
+    queue_dir = os.path.join(output_dir, 'queue')
+    os.makedirs(queue_dir)
+    for (name, data) in queue:
+        with open(os.path.join(queue_dir, name), 'wb') as file:
+            file.write(data)
+    env = dict(
+        os.environ,
+        PYTHON_AFL_ENGINE=output_dir,
+        PYTHON_AFL_ENGINE_INPUT=input_dir,
+        PYTHON_AFL_ENGINE_RUNS=str(runs),
+        PYTHON_AFL_ENGINE_JOBS=str(jobs),
+        PYTHON_AFL_ENGINE_SEED='42',
+    )
+    child = ipc.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, target],
+        stdout=ipc.PIPE,
+        stderr=ipc.PIPE,
+        env=env,
+    )
+    (stdout, stderr) = child.communicate()
+    assert_equal(child.returncode, 0)
+    assert_equal(stdout, b'')
+    return stderr.decode('ASCII', 'replace')
+
+def read_dir(path):
+    result = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as file:
+            result += [(name, file.read())]
+    return result
+
+def test_find_crash():
+    with tempdir() as tmpdir:
+        output_dir = os.path.join(tmpdir, 'output')
+        stderr = run_engine(tmpdir, seeds=[b'FUxx'], runs=100000)
+        assert_in('RuntimeError: Found it!', stderr)
+        crashes = read_dir(os.path.join(output_dir, 'crashes'))
+        assert_equal(len(crashes), 1)
+        [(name, data)] = crashes
+        assert_true(name.startswith('crash-'))
+        assert_equal(data[:4], b'FUZZ')
+        # the inputs that reached 'Z' were added to the queue
+        queue = read_dir(os.path.join(output_dir, 'queue'))
+        assert_in(b'FUZ', [data[:3] for (name, data) in queue])
+
+def test_sync():
+    # inputs found by other workers are picked up from the queue directory
+    with tempdir() as tmpdir:
+        output_dir = os.path.join(tmpdir, 'output')
+        stderr = run_engine(tmpdir, queue=[('w9-000000', b'FUZZ')], runs=10)
+        assert_in('RuntimeError: Found it!', stderr)
+        crashes = read_dir(os.path.join(output_dir, 'crashes'))
+        assert_equal([data for (name, data) in crashes], [b'FUZZ'])
+
+def test_jobs():
+    with tempdir() as tmpdir:
+        stderr = run_engine(tmpdir, seeds=[b'F'], jobs=2)
+        for worker in [0, 1]:
+            assert_in('[worker {0}] execs: 1000,'.format(worker), stderr)
+
+# vim:ts=4 sts=4 sw=4 et
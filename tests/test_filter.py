@@ -0,0 +1,92 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import sys
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_raises_regex,
+    assert_true,
+    traced_map,
+)
+
+here = os.path.dirname(os.path.abspath(__file__))
+package = __name__.rpartition('.')[0]
+
+def target():
+    return [c for c in 'moo' if c == 'o']
+
+def tracers():
+    yield 'settrace'
+    yield 'ctrace'
+    if hasattr(sys, 'monitoring'):
+        yield 'monitoring'
+
+def nonempty(area):
+    return any(bytearray(area))
+
+def _test(xnonempty, **kwargs):
+    for tracer in tracers():
+        env = dict(PYTHON_AFL_TRACER=tracer)
+        assert_equal(nonempty(traced_map(target, env, **kwargs)), xnonempty)
+
+# The tests are run from the “tests” package;
+# sys.monitoring instruments also code in tests/tools.py.
+
+def test_include_module():
+    _test(True, include=[__name__])
+    _test(True, include=[package])
+    _test(False, include=['nonexistent'])
+
+def test_exclude_module():
+    _test(False, exclude=[package])
+    _test(True, exclude=['nonexistent'])
+
+def test_include_glob():
+    _test(True, include=['*/test_filter.py'])
+    _test(True, include=[here + '/*'])
+    _test(False, include=['*/nonexistent.py'])
+
+def test_exclude_glob():
+    _test(False, exclude=[here + '/*'])
+    _test(True, exclude=['*/nonexistent.py'])
+
+def test_include_exclude():
+    _test(False, include=[package], exclude=['*/test_*.py', '*/tools.py'])
+
+def test_env():
+    for tracer in tracers():
+        env = dict(
+            PYTHON_AFL_TRACER=tracer,
+            PYTHON_AFL_EXCLUDE='nonexistent, {pkg}'.format(pkg=package),
+        )
+        assert_equal(nonempty(traced_map(target, env)), False)
+        assert_true(nonempty(traced_map(target, env, exclude=[])))
+
+def test_bad_keyword():
+    with assert_raises_regex(TypeError, "^init[(][)] got an unexpected keyword argument 'eggs'$"):
+        afl.init(eggs=42)
+
+# vim:ts=4 sts=4 sw=4 et
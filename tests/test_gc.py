@@ -0,0 +1,115 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import gc
+import os
+import sys
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_raises_regex,
+    assert_true,
+    fork_server,
+    tempdir,
+)
+
+def _test_child_gc(env, check):
+    def target():
+        afl.init()
+        check()
+    with fork_server(target, env) as server:
+        server.read()
+        (_, status) = server.run()
+        assert_equal(status, 0)
+
+def test_freeze():
+    def check():
+        if hasattr(gc, 'get_freeze_count'):
+            assert_true(gc.get_freeze_count() > 0)
+        assert_true(gc.isenabled())
+    _test_child_gc(dict(PYTHON_AFL_GC_FREEZE='1'), check)
+
+def test_child_gc_disable():
+    def check():
+        assert_true(not gc.isenabled())
+    _test_child_gc(dict(PYTHON_AFL_CHILD_GC='disable'), check)
+
+def test_child_gc_thresholds():
+    def check():
+        assert_true(gc.isenabled())
+        assert_equal(gc.get_threshold(), (10000, 20, 30))
+    _test_child_gc(dict(PYTHON_AFL_CHILD_GC='10000,20,30'), check)
+
+def test_bad_child_gc():
+    for value in ['enable', '1,2,3,4', '-1']:
+        os.environ['PYTHON_AFL_CHILD_GC'] = value
+        try:
+            with assert_raises_regex(RuntimeError, r'^invalid PYTHON_AFL_CHILD_GC: '):
+                afl.init()
+        finally:
+            del os.environ['PYTHON_AFL_CHILD_GC']
+
+def test_dirty_pages_log():
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return
+    with tempdir() as tmpdir:
+        log_path = os.path.join(tmpdir, 'log')
+        env = dict(
+            PYTHON_AFL_PERSISTENT='1',
+            PYTHON_AFL_DIRTY_PAGES_LOG=log_path,
+        )
+        def target():
+            while afl.loop(2):
+                pass
+        with fork_server(target, env) as server:
+            server.read()
+            (pid1, status) = server.run()
+            assert_true(os.WIFSTOPPED(status))
+            (pid2, status) = server.run()
+            assert_equal(pid2, pid1)
+            assert_equal(status, 0)
+        with open(log_path, 'rb') as file:
+            lines = file.read().splitlines()
+    assert_equal(len(lines), 2)
+    for line in lines:
+        (pid, pages) = line.split()
+        assert_equal(int(pid), pid1)
+        assert_true(int(pages) > 0)
+
+def test_dirty_pages_log_crash():
+    # the pages are counted before the excepthook kills the process
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        return
+    with tempdir() as tmpdir:
+        log_path = os.path.join(tmpdir, 'log')
+        code = 'import afl\nafl.init()\nraise RuntimeError'
+        env = dict(PYTHON_AFL_DIRTY_PAGES_LOG=log_path)
+        with afl.Driver([sys.executable, '-c', code], env=env, quiet=True) as driver:
+            status = driver.run(b'')
+            assert_true(os.WIFSIGNALED(status))
+        with open(log_path, 'rb') as file:
+            lines = file.read().splitlines()
+    assert_equal(len(lines), 1)
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,84 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import sys
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_not_equal,
+    assert_true,
+    tempdir,
+)
+
+here = os.path.dirname(__file__)
+
+def run_maps(target, table_path, inputs, **env):
+    env.update(PYTHON_AFL_ID_TABLE=table_path)
+    with afl.Driver([sys.executable, target], env=env, quiet=True) as driver:
+        return [bits for (status, bits) in driver.run_many(inputs)]
+
+def read_table(path):
+    with open(path, 'rb') as file:
+        return file.read().splitlines()
+
+def _test_id_table(target, **env):
+    # in persistent mode, the first iteration has extra coverage:
+    inputs = [b'0', b'0', b'0', b'1']
+    with tempdir() as workdir:
+        table_path = workdir + '/ids'
+        maps = run_maps(target, table_path, inputs, **env)
+        assert_equal(maps[1], maps[2])
+        assert_not_equal(maps[2], maps[3])
+        table = read_table(table_path)
+        assert_equal(len(table), len(set(table)))
+        name = os.path.basename(target).encode('ASCII')
+        assert_true(len([e for e in table if e.startswith(name + b'\t')]) > 0)
+        # the IDs are stable across restarts:
+        assert_equal(run_maps(target, table_path, inputs, **env), maps)
+        assert_equal(read_table(table_path), table)
+
+def test_id_table():
+    _test_id_table(here + '/target.py')
+
+def test_id_table_persistent():
+    _test_id_table(here + '/target_persistent.py')
+
+def test_id_table_prewarm():
+    _test_id_table(here + '/target.py', PYTHON_AFL_PREWARM='1')
+
+def test_relocation():
+    with tempdir() as workdir:
+        table_path = workdir + '/ids'
+        maps = []
+        for subdir in 'ab':
+            os.mkdir(os.path.join(workdir, subdir))
+            target = os.path.join(workdir, subdir, 'target.py')
+            shutil.copy(here + '/target.py', target)
+            maps += [run_maps(target, table_path, [b'0', b'0', b'1'])]
+        # the IDs don't depend on where the code lives:
+        assert_equal(maps[0], maps[1])
+
+# vim:ts=4 sts=4 sw=4 et
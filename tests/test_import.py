@@ -27,8 +27,13 @@ from .tools import (
 )
 
 exports = [
+    'Driver',
+    'fuzz',
     'init',
+    'install_import_hook',
     'loop',
+    'run_async',
+    'testcase',
 ]
 
 deprecated = [
@@ -0,0 +1,113 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import importlib
+import io
+import os
+import sys
+
+import afl
+
+from .tools import (
+    SkipTest,
+    assert_equal,
+    assert_not_equal,
+    assert_raises_regex,
+    assert_true,
+    tempdir,
+    traced_map,
+)
+
+module_source = '''\
+"""docstring"""
+from __future__ import division
+
+def f(x):
+    """docstring"""
+    if x:
+        y = 'a'
+    else:
+        y = 'b'
+    z = 'c' if x > 1 else 'd'
+    return y + z + str(x or 'e') + str(x and 'f')
+
+g = lambda x: x // 2
+'''
+
+def _require_hook():
+    if sys.version_info < (3, 6):
+        raise SkipTest('Python >= 3.6 is required')
+
+def _run(path, arg, **kwargs):
+    def target():
+        afl.install_import_hook()
+        sys.path.insert(0, path)
+        mod = importlib.import_module('afl_hook_test')
+        assert_equal(mod.__doc__, 'docstring')
+        assert_equal(mod.f.__doc__, 'docstring')
+        xresult = {0: 'bde0', 1: 'ad1f', 2: 'ac2f'}[arg]
+        assert_equal(mod.f(arg), xresult)
+        assert_equal(mod.g(5), 2)
+    env = dict(PYTHON_AFL_TRACER='none')
+    return traced_map(target, env, **kwargs)
+
+def _test(**kwargs):
+    with tempdir() as path:
+        with io.open(os.path.join(path, 'afl_hook_test.py'), 'w', encoding='UTF-8') as file:
+            file.write(module_source)
+        return [_run(path, arg, **kwargs) for arg in (0, 1, 1, 2)]
+
+def nonempty(area):
+    return any(bytearray(area))
+
+def test_probes():
+    _require_hook()
+    (map0, map1, map1_again, map2) = _test()
+    assert_true(nonempty(map0))
+    assert_not_equal(map0, map1)
+    assert_not_equal(map1, map2)
+    assert_equal(map1, map1_again)
+
+def test_cache():
+    _require_hook()
+    with tempdir() as path:
+        with io.open(os.path.join(path, 'afl_hook_test.py'), 'w', encoding='UTF-8') as file:
+            file.write(module_source)
+        map1 = _run(path, 1)
+        cache_dir = os.path.join(path, '__pycache__')
+        cache_files = [f for f in os.listdir(cache_dir) if '.opt-afl.' in f]
+        assert_equal(len(cache_files), 1)
+        map1_cached = _run(path, 1)
+        assert_equal(map1, map1_cached)
+
+def test_exclude():
+    _require_hook()
+    for area in _test(exclude=['afl_hook_test']):
+        assert_true(not nonempty(area))
+
+def test_unsupported():
+    if sys.version_info >= (3, 6):
+        raise SkipTest('Python < 3.6 is required')
+    with assert_raises_regex(RuntimeError, r'^the import hook requires Python >= 3[.]6$'):
+        afl.install_import_hook()
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,101 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import os
+import signal
+import subprocess as ipc
+import sys
+import time
+
+from .tools import (
+    assert_equal,
+    require_commands,
+    tempdir,
+)
+
+fake_fuzzer = r'''#!/bin/sh
+# record how we were started
+cpus=$(sed -n -e 's/^Cpus_allowed_list:\s*//p' /proc/self/status)
+printf '%s %s %s %s %s %s %s\n' "$1" "$2" \
+    "$PYTHON_AFL_PERSISTENT" "$PYTHON_AFL_SIGNAL" "$AFL_NO_AFFINITY" "${AFL_AUTORESUME:--}" "$cpus" \
+    >> "$FAKE_FUZZER_LOG"
+if [ "$2" = secondary1 ] && ! [ -e "$FAKE_FUZZER_LOG.died" ]
+then
+    touch "$FAKE_FUZZER_LOG.died"
+    exit 1
+fi
+exec sleep 60
+'''
+
+def read_log(path):
+    try:
+        with io.open(path, 'rt', encoding='UTF-8') as file:
+            return file.read().splitlines()
+    except IOError:
+        return []
+
+def test_launch():
+    require_commands('py-afl-launch')
+    with tempdir() as tmpdir:
+        bindir = os.path.join(tmpdir, 'bin')
+        os.mkdir(bindir)
+        fuzzer_path = os.path.join(bindir, 'py-afl-fuzz')
+        with open(fuzzer_path, 'wb') as file:
+            file.write(fake_fuzzer.encode('ASCII'))
+        os.chmod(fuzzer_path, 0o755)
+        log_path = os.path.join(tmpdir, 'log')
+        env = dict(
+            os.environ,
+            PATH=bindir + os.pathsep + os.environ['PATH'],
+            FAKE_FUZZER_LOG=log_path,
+        )
+        env.pop('PYTHON_AFL_SIGNAL', None)
+        output_dir = os.path.join(tmpdir, 'out')
+        cmdline = [
+            'py-afl-launch', '--jobs', '3', '--cpus', '0', '--stagger', '0',
+            '-i', tmpdir, '-o', output_dir, '--', sys.executable, 'target.py',
+        ]
+        launcher = ipc.Popen(cmdline, stdout=ipc.PIPE, env=env)  # pylint: disable=consider-using-with
+        try:
+            timeout = 10
+            while timeout > 0 and len(read_log(log_path)) < 4:
+                time.sleep(0.1)
+                timeout -= 0.1
+        finally:
+            launcher.send_signal(signal.SIGTERM)
+            launcher.communicate()
+        assert_equal(launcher.returncode, 0)
+        log = sorted(read_log(log_path))
+        assert_equal(log, [
+            '-M main 1 SIGUSR1 1 - 0',
+            '-S secondary1 1 SIGUSR1 1 - 0',
+            # restarted:
+            '-S secondary1 1 SIGUSR1 1 1 0',
+            '-S secondary2 1 SIGUSR1 1 - 0',
+        ])
+        assert_equal(
+            sorted(os.listdir(output_dir)),
+            ['main.log', 'secondary1.log', 'secondary2.log'],
+        )
+
+# vim:ts=4 sts=4 sw=4 et
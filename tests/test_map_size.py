@@ -0,0 +1,105 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_raises_regex,
+    assert_true,
+    fork_isolation,
+    fork_server,
+    shared_map,
+    traced_map,
+)
+
+def target():
+    n = 0
+    for i in range(10):
+        if i % 2:
+            n += 1
+        else:
+            n -= 1
+    return n
+
+def max_index(area):
+    return max(i for (i, n) in enumerate(bytearray(area)) if n)
+
+def test_map_size():
+    size = 1 << 20
+    area = traced_map(target, map_size=size)
+    assert_equal(len(area), size)
+    assert_true(max_index(area) >= (1 << 16))
+
+def test_env():
+    size = 1 << 20
+    area = traced_map(target, env=dict(AFL_MAP_SIZE=str(size)))
+    assert_true(max_index(area) >= (1 << 16))
+
+def test_small_map():
+    area = traced_map(target, map_size=64)
+    assert_true(max_index(area) < 64)
+
+def test_bad_map_size():
+    for size in [0, 1, (1 << 23) + 1]:
+        with assert_raises_regex(ValueError, r'^invalid map size: '):
+            afl.init(map_size=size)
+
+@fork_isolation
+def test_double_init():
+    with shared_map() as area:
+        afl.init()
+        with assert_raises_regex(RuntimeError, '^AFL already initialized$'):
+            afl.init(map_size=1 << 23)
+        # the map size is unchanged
+        target()
+        assert_true(max_index(area) < (1 << 16))
+
+def test_shm_too_small():
+    def init():
+        with assert_raises_regex(RuntimeError, r'^shared memory segment is smaller than the map size: '):
+            afl.init(map_size=1 << 17)
+    with shared_map(1 << 16):
+        with fork_server(init) as server:
+            server.read()
+            (pid, status) = server.run()
+            assert_true(pid > 0)
+            assert_equal(status, 0)
+
+def _test_hello(size, env=()):
+    with fork_server(afl.init, env) as server:
+        hello = server.read()
+        assert_equal(hello, 0x80000001 | 0x40000000 | ((size - 1) << 1))
+        (pid, status) = server.run()
+        assert_true(pid > 0)
+        assert_true(os.WIFEXITED(status))
+        assert_equal(os.WEXITSTATUS(status), 0)
+
+def test_hello():
+    _test_hello(1 << 16)
+
+def test_hello_map_size():
+    _test_hello(1 << 20, env=dict(AFL_MAP_SIZE=str(1 << 20)))
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,75 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import signal
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_not_equal,
+    assert_true,
+    fork_server,
+)
+
+def target():
+    while afl.loop(3):
+        pass
+
+def _test(env):
+    env = dict(env, PYTHON_AFL_PERSISTENT='1')
+    with fork_server(target, env) as server:
+        server.read()
+        pids = set()
+        for _ in range(2):
+            for _ in range(2):
+                (pid, status) = server.run()
+                pids.add(pid)
+                assert_true(os.WIFSTOPPED(status))
+                assert_equal(os.WSTOPSIG(status), signal.SIGSTOP)
+            (pid, status) = server.run()
+            pids.add(pid)
+            assert_equal(status, 0)
+        assert_equal(len(pids), 2)
+        # kill a stopped child, as afl-fuzz does on timeout
+        (pid, status) = server.run()
+        assert_true(os.WIFSTOPPED(status))
+        os.kill(pid, signal.SIGKILL)
+        (new_pid, status) = server.run(child_killed=1)
+        assert_not_equal(new_pid, pid)
+        assert_true(os.WIFSTOPPED(status))
+        os.kill(new_pid, signal.SIGKILL)
+
+def test_sigstop():
+    _test({})
+
+def test_pipe():
+    _test(dict(PYTHON_AFL_PERSISTENT_PIPE='1'))
+
+def test_prefork():
+    _test(dict(PYTHON_AFL_PREFORK='1'))
+
+def test_prefork_pipe():
+    _test(dict(PYTHON_AFL_PREFORK='1', PYTHON_AFL_PERSISTENT_PIPE='1'))
+
+# vim:ts=4 sts=4 sw=4 et
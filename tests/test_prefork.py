@@ -0,0 +1,66 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_true,
+    fork_server,
+    tempdir,
+)
+
+def test_prefork():
+    with tempdir() as tmpdir:
+        log_path = os.path.join(tmpdir, 'log')
+        def target():
+            afl.init()
+            with open(log_path, 'ab') as file:
+                file.write('{0}\n'.format(os.getpid()).encode('ASCII'))
+        env = dict(PYTHON_AFL_PREFORK='1')
+        with fork_server(target, env) as server:
+            server.read()
+            pids = []
+            for _ in range(3):
+                (pid, status) = server.run()
+                assert_equal(status, 0)
+                pids += [pid]
+        with open(log_path, 'rb') as file:
+            logged_pids = [int(line) for line in file]
+    assert_equal(len(set(pids)), 3)
+    # only the released children ran
+    assert_equal(logged_pids, pids)
+
+def test_prefork_crash():
+    def target():
+        afl.init()
+        os.abort()
+    env = dict(PYTHON_AFL_PREFORK='1')
+    with fork_server(target, env) as server:
+        server.read()
+        for _ in range(2):
+            (_, status) = server.run()
+            assert_true(os.WIFSIGNALED(status))
+
+# vim:ts=4 sts=4 sw=4 et
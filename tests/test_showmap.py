@@ -24,8 +24,11 @@ import os
 import sys
 
 from .tools import (
+    assert_equal,
     assert_in,
     assert_not_equal,
+    assert_regex,
+    python_command,
     require_commands,
     run,
     tempdir,
@@ -62,4 +65,35 @@ def test_exception():
     )
     assert_not_equal(out, b'')
 
+def _test_batch(script):
+    inputs = {'zero': b'0', 'zero2': b'00', 'one': b'1', 'crash': b'\xFF'}
+    with tempdir() as workdir:
+        indir = workdir + '/in'
+        outdir = workdir + '/out'
+        os.mkdir(indir)
+        for (name, data) in inputs.items():
+            with open(indir + '/' + name, 'wb') as file:
+                file.write(data)
+        (stdout, stderr) = run(
+            python_command('py-afl-showmap-batch') + ['-q', '-i', indir, '-o', outdir, '--', sys.executable, script],
+        )
+        assert_equal(stdout, b'')
+        assert_in(b': 4 inputs, 1 crashes, 0 timeouts,', stderr)
+        maps = {}
+        for name in inputs:
+            with open(outdir + '/' + name, 'rb') as file:
+                maps[name] = file.read()
+    for name in inputs:
+        for line in maps[name].splitlines():
+            assert_regex(line, b'^[0-9]{6}:[0-9]+$')
+    assert_equal(maps['zero'], maps['zero2'])
+    assert_not_equal(maps['zero'], maps['one'])
+    assert_not_equal(maps['zero'], maps['crash'])
+
+def test_batch():
+    _test_batch(target)
+
+def test_batch_persistent():
+    _test_batch(here + '/target_persistent.py')
+
 # vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,83 @@
+# encoding=UTF-8
+
+# Copyright © 2015-2021 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import io
+import json
+import os
+import sys
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_true,
+    tempdir,
+)
+
+here = os.path.dirname(__file__)
+
+def run_stats(target, inputs, env=(), **kwargs):
+    with tempdir() as workdir:
+        path = workdir + '/stats.json'
+        env = dict(env, PYTHON_AFL_STATS=path)
+        with afl.Driver([sys.executable, target], env=env, quiet=True, **kwargs) as driver:
+            for data in inputs:
+                driver.run(data)
+        with io.open(path, 'rt', encoding='UTF-8') as file:
+            return json.load(file)
+
+def _test_stats(target):
+    stats = run_stats(target, [b'0', b'1', b'\xFF'] * 3)
+    assert_equal(stats['execs'], 9)
+    assert_true(stats['events'] > 0)
+    assert_true(stats['callback_time'] > 0)
+    [file_stats] = [f for f in stats['files'] if f['filename'] == target]
+    assert_true(file_stats['events'] > 0)
+    names = set(c['name'] for c in stats['code'] if c['filename'] == target)
+    assert_true('main' in names)
+    assert_equal(stats['coverage'], 'line')
+    map_stats = stats['map']
+    assert_equal(map_stats['size'], 1 << 16)
+    assert_true(map_stats['used'] > 0)
+    assert_true(map_stats['locations'] > 0)
+
+def test_stats():
+    _test_stats(here + '/target.py')
+
+def test_stats_persistent():
+    _test_stats(here + '/target_persistent.py')
+
+def test_coverage_mode():
+    for coverage in ['ctx', 'ngram-3']:
+        env = dict(PYTHON_AFL_COVERAGE=coverage)
+        stats = run_stats(here + '/target.py', [b'0'], env=env)
+        assert_equal(stats['coverage'], coverage)
+
+def test_collisions():
+    stats = run_stats(here + '/target.py', [b'0', b'1'], map_size=4)
+    map_stats = stats['map']
+    assert_equal(map_stats['size'], 4)
+    assert_true(map_stats['colliding_locations'] > 0)
+    assert_true(map_stats['collision_rate'] > 0)
+    assert_true(map_stats['expected_collision_rate'] > 0)
+
+# vim:ts=4 sts=4 sw=4 et
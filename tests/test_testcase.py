@@ -0,0 +1,111 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import signal
+import struct
+import tempfile
+
+import afl
+
+from .tools import (
+    assert_equal,
+    assert_true,
+    fork_server,
+    shared_map,
+    tempdir,
+)
+
+FS_OPT_ENABLED = 0x80000001
+FS_OPT_SHDMEM_FUZZ = 0x01000000
+
+def put_testcase(area, data):
+    header = struct.pack('I', len(data))
+    area[:len(header) + len(data)] = bytearray(header + data)
+
+def _test_shared_input(persistent):
+    inputs = [b'foo', b'', b'\0' * 1000, b'bar']
+    with tempdir() as tmpdir:
+        output_path = os.path.join(tmpdir, 'output')
+        def target():
+            with open(output_path, 'ab') as file:
+                if persistent:
+                    while afl.loop(shared_input=True):
+                        data = afl.testcase()
+                        assert_true(isinstance(data, memoryview))
+                        file.write(repr(data.tobytes()).encode('ASCII') + b'\n')
+                        file.flush()
+                else:
+                    afl.init(shared_input=True)
+                    data = afl.testcase()
+                    assert_true(isinstance(data, memoryview))
+                    file.write(repr(data.tobytes()).encode('ASCII') + b'\n')
+        env = {}
+        if persistent:
+            env.update(PYTHON_AFL_PERSISTENT='1')
+        with shared_map(1 << 12, env_var='__AFL_SHM_FUZZ_ID') as area:
+            with fork_server(target, env) as server:
+                hello = server.read()
+                assert_true(hello & FS_OPT_SHDMEM_FUZZ)
+                server.write(FS_OPT_ENABLED | FS_OPT_SHDMEM_FUZZ)
+                for data in inputs:
+                    put_testcase(area, data)
+                    (pid, status) = server.run()
+                    if persistent:
+                        assert_true(os.WIFSTOPPED(status))
+                    else:
+                        assert_equal(status, 0)
+                if persistent:
+                    os.kill(pid, signal.SIGKILL)
+        with open(output_path, 'rb') as file:
+            output = file.read()
+    assert_equal(output, b''.join(repr(data).encode('ASCII') + b'\n' for data in inputs))
+
+def test_shared_input():
+    _test_shared_input(persistent=False)
+
+def test_shared_input_persistent():
+    _test_shared_input(persistent=True)
+
+def test_no_shared_input():
+    # without shared_input=True, the fuzzer is not asked for shared memory
+    with shared_map(1 << 12, env_var='__AFL_SHM_FUZZ_ID'):
+        with fork_server(afl.init) as server:
+            hello = server.read()
+            assert_equal(hello & FS_OPT_SHDMEM_FUZZ, 0)
+
+def test_stdin():
+    with tempfile.TemporaryFile() as file:
+        file.write(b'foo')
+        file.flush()
+        def target():
+            os.dup2(file.fileno(), 0)
+            afl.init(shared_input=True)
+            for _ in range(2):
+                assert_equal(afl.testcase().tobytes(), b'foo')
+        with fork_server(target) as server:
+            hello = server.read()
+            assert_equal(hello & FS_OPT_SHDMEM_FUZZ, 0)
+            (_, status) = server.run()
+            assert_equal(status, 0)
+
+# vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,72 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import sys
+import threading
+
+from .tools import (
+    assert_equal,
+    assert_not_equal,
+    traced_map,
+)
+
+def tracers():
+    yield 'settrace'
+    yield 'ctrace'
+    if hasattr(sys, 'monitoring'):
+        yield 'monitoring'
+
+def coverages():
+    yield 'line'
+    if sys.version_info >= (3, 7):
+        yield 'branch'
+
+def parity(n):
+    if n % 2:
+        return 'odd'
+    else:
+        return 'even'
+
+def in_thread(n):
+    def target():
+        result = []
+        thread = threading.Thread(target=lambda: result.append(parity(n)))
+        thread.start()
+        thread.join()
+        assert_equal(result, [['even', 'odd'][n % 2]])
+    return target
+
+def nonzero(area):
+    return {i: n for (i, n) in enumerate(bytearray(area)) if n}
+
+def test_thread():
+    for tracer in tracers():
+        for coverage in coverages():
+            env = dict(PYTHON_AFL_TRACER=tracer, PYTHON_AFL_COVERAGE=coverage)
+            [map0, map1, map2] = [
+                nonzero(traced_map(in_thread(n), env))
+                for n in (0, 1, 2)
+            ]
+            assert_not_equal(map0, map1)
+            assert_equal(map0, map2)
+
+# vim:ts=4 sts=4 sw=4 et
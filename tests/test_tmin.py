@@ -25,7 +25,7 @@ import sys
 
 from .tools import (
     assert_equal,
-    require_commands,
+    python_command,
     run,
     tempdir,
 )
@@ -33,15 +33,17 @@ from .tools import (
 here = os.path.dirname(__file__)
 target = here + '/target.py'
 
-def run_afl_tmin(input, xoutput, xstatus=0):
-    require_commands('py-afl-tmin', 'afl-tmin')
+def run_afl_tmin(input, xoutput, xstatus=0, script=target, jobs=None):
     with tempdir() as workdir:
         inpath = workdir + '/in'
         with open(inpath, 'wb') as file:
             file.write(input)
         outpath = workdir + '/out'
+        cmdline = python_command('py-afl-tmin') + ['-i', inpath, '-o', outpath]
+        if jobs is not None:
+            cmdline += ['-T', str(jobs)]
         run(
-            ['py-afl-tmin', '-i', inpath, '-o', outpath, '--', sys.executable, target],
+            cmdline + ['--', sys.executable, script],
             xstatus=xstatus,
         )
         with open(outpath, 'rb') as file:
@@ -55,4 +57,11 @@ def test():
 def test_exc():
     run_afl_tmin(b'\xCF\x87', b'\x87')
 
+def test_parallel():
+    run_afl_tmin(b'X' * 100, b'X', jobs=4)
+
+def test_crash_signature():
+    # persistent target; the crash is identified by its signature
+    run_afl_tmin(b'FUZZ' + b'x' * 20, b'FUZZ', script=here + '/target_engine.py')
+
 # vim:ts=4 sts=4 sw=4 et
@@ -0,0 +1,133 @@
+# encoding=UTF-8
+
+# Copyright © 2026 Jakub Wilk <jwilk@jwilk.net>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ctypes
+import os
+import sys
+
+import afl
+
+from .tools import (
+    SkipTest,
+    assert_equal,
+    assert_not_equal,
+    assert_raises_regex,
+    assert_true,
+    fork_isolation,
+    shared_map,
+    traced_map,
+)
+
+here = os.path.dirname(__file__)
+
+def target(s='0101'):
+    n = 0
+    for c in s:
+        n += 1 if c == '0' else 2
+    return n
+
+def require_monitoring():
+    if not hasattr(sys, 'monitoring'):
+        raise SkipTest('sys.monitoring is not available')
+
+def _test_tracer(tracer):
+    os.environ['PYTHON_AFL_TRACER'] = tracer
+    with shared_map() as area:
+        afl.init()
+        target('01')
+        assert_true(any(area))
+
+@fork_isolation
+def test_settrace():
+    _test_tracer('settrace')
+
+@fork_isolation
+def test_ctrace():
+    _test_tracer('ctrace')
+
+@fork_isolation
+def test_monitoring():
+    require_monitoring()
+    _test_tracer('monitoring')
+
+@fork_isolation
+def test_unknown_tracer():
+    os.environ['PYTHON_AFL_TRACER'] = 'eggs'
+    with shared_map():
+        with assert_raises_regex(RuntimeError, "^unknown PYTHON_AFL_TRACER: 'eggs'$"):
+            afl.init()
+
+def test_loop():
+    for coverage in ['line', 'branch']:
+        _test_loop('settrace', coverage)
+        _test_loop('ctrace', coverage)
+        _test_loop('monitoring', coverage)
+
+@fork_isolation
+def _test_loop(tracer, coverage):
+    if tracer == 'monitoring':
+        require_monitoring()
+    os.environ['PYTHON_AFL_TRACER'] = tracer
+    os.environ['PYTHON_AFL_COVERAGE'] = coverage
+    os.environ['PYTHON_AFL_PERSISTENT'] = '1'
+    os.kill = lambda pid, sig: None
+    hits = []
+    with shared_map() as area:
+        while afl.loop(3):
+            ctypes.memset(area, 0, len(area))
+            target('0101')
+            hits += [sum(area)]
+    assert_equal(len(hits), 3)
+    assert_not_equal(hits[0], 0)
+    assert_equal(hits, [hits[0]] * 3)
+
+def test_code_cache():
+    tracers = ['settrace', 'ctrace']
+    if hasattr(sys, 'monitoring'):
+        tracers += ['monitoring']
+    for tracer in tracers:
+        env = dict(PYTHON_AFL_TRACER=tracer)
+        xmap = traced_map(target, env)
+        assert_true(any(xmap))
+        assert_equal(traced_map(target, env, prewarm=True), xmap)
+        env.update(PYTHON_AFL_CODE_CACHE_SIZE='1')
+        assert_equal(traced_map(target, env), xmap)
+
+def driver_maps(script, tracer, coverage):
+    env = dict(PYTHON_AFL_TRACER=tracer, PYTHON_AFL_COVERAGE=coverage)
+    with afl.Driver([sys.executable, here + '/' + script], env=env, quiet=True) as driver:
+        return [bytes(bits) for (status, bits) in driver.run_many([b'0', b'1'])]
+
+def test_same_map():
+    # all the backends see the same events
+    tracers = ['ctrace']
+    if hasattr(sys, 'monitoring'):
+        tracers += ['monitoring']
+    for coverage in ['line', 'ctx', 'ngram-3']:
+        for script in ['target.py', 'target_persistent.py']:
+            xmaps = driver_maps(script, 'settrace', coverage)
+            assert_true(any(xmaps[0]))
+            assert_not_equal(xmaps[0], xmaps[1])
+            for tracer in tracers:
+                assert_equal(driver_maps(script, tracer, coverage), xmaps)
+
+# vim:ts=4 sts=4 sw=4 et
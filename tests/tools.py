@@ -23,10 +23,13 @@
 from __future__ import print_function
 
 import contextlib
+import ctypes
 import functools
 import os
 import re
 import shutil
+import signal
+import struct
 import subprocess as ipc
 import sys
 import tempfile
@@ -34,6 +37,8 @@ import traceback
 import unittest
 import warnings
 
+import afl
+
 try:
     # Python >= 3.3
     from shlex import quote as sh_quote
@@ -114,15 +119,18 @@ def clean_environ():
     os.environ['AFL_ALLOW_TMP'] = '1'  # AFL >= 2.48b
     os.environ['PWD'] = '//' + os.getcwd()  # poor man's AFL_ALLOW_TMP for AFL << 2.48b
 
-def require_commands(*cmds):
+def find_command(cmd):
     PATH = os.environ.get('PATH', os.defpath)
     PATH = PATH.split(os.pathsep)
+    for dir in PATH:
+        path = os.path.join(dir, cmd)
+        if os.access(path, os.X_OK):
+            return path
+    return None
+
+def require_commands(*cmds):
     for cmd in cmds:
-        for dir in PATH:
-            path = os.path.join(dir, cmd)
-            if os.access(path, os.X_OK):
-                break
-        else:
+        if find_command(cmd) is None:
             if cmd == 'ps':
                 cmd = 'ps(1)'
                 reason = 'procps installed'
@@ -132,6 +140,12 @@ def require_commands(*cmds):
                 reason = 'PATH set correctly'
             raise RuntimeError('{cmd} not found; is {reason}?'.format(cmd=cmd, reason=reason))
 
+def python_command(cmd):
+    # Python scripts are run with the current interpreter,
+    # which is not necessarily the one in their shebang.
+    require_commands(cmd)
+    return [sys.executable, find_command(cmd)]
+
 def run(cmd, stdin='', xstatus=0):
     cmd = list(cmd)
     child = ipc.Popen(  # pylint: disable=consider-using-with
@@ -227,6 +241,111 @@ def tempdir():
     finally:
         shutil.rmtree(d)
 
+@contextlib.contextmanager
+def shared_map(size=(1 << 16), env_var='__AFL_SHM_ID'):
+    # create SysV shared memory segment, the same way afl-fuzz does
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+    shm_id = libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+    if shm_id < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    try:
+        addr = libc.shmat(shm_id, None, 0)
+        if addr == ctypes.c_void_p(-1).value:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        os.environ[env_var] = str(shm_id)
+        yield (ctypes.c_ubyte * size).from_address(addr)
+    finally:
+        os.environ.pop(env_var, None)
+        libc.shmctl(shm_id, IPC_RMID, None)
+
+def traced_map(target, env=(), **kwargs):
+    # run target() with instrumentation in a child process;
+    # return the resulting map
+    size = kwargs.get('map_size') or int(dict(env).get('AFL_MAP_SIZE', 1 << 16))
+    with shared_map(size) as area:
+        pid = os.fork()
+        if pid == 0:
+            # pylint: disable=protected-access
+            try:
+                os.environ.update(env)
+                afl.init(**kwargs)
+                target()
+            except BaseException:  # pylint: disable=broad-except
+                traceback.print_exc()
+                os._exit(1)
+            os._exit(0)
+        (pid, status) = os.waitpid(pid, 0)
+        if status != 0:
+            raise RuntimeError('unexpected child process status {0}'.format(status))
+        return bytes(bytearray(area))
+
+afl_forksrv_fd = 198
+
+class ForkServer(object):
+
+    def __init__(self, pid, ctl_fd, st_fd):
+        self.pid = pid
+        self.ctl_fd = ctl_fd
+        self.st_fd = st_fd
+
+    def read(self):
+        data = os.read(self.st_fd, 4)
+        if len(data) != 4:
+            raise EOFError
+        [n] = struct.unpack('I', data)
+        return n
+
+    def write(self, n):
+        os.write(self.ctl_fd, struct.pack('I', n))
+
+    def run(self, child_killed=0):
+        # request a new child; return its pid and status
+        self.write(child_killed)
+        pid = self.read()
+        status = self.read()
+        return (pid, status)
+
+@contextlib.contextmanager
+def fork_server(target, env=()):
+    # run target() in a child process,
+    # with the fork server pipes set up the way afl-fuzz does;
+    # yield ForkServer object that talks to it
+    (ctl_r, ctl_w) = os.pipe()
+    (st_r, st_w) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # pylint: disable=protected-access
+        try:
+            os.dup2(ctl_r, afl_forksrv_fd)
+            os.dup2(st_w, afl_forksrv_fd + 1)
+            for fd in (ctl_r, ctl_w, st_r, st_w):
+                os.close(fd)
+            os.environ.update(env)
+            target()
+        except BaseException:  # pylint: disable=broad-except
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    os.close(ctl_r)
+    os.close(st_w)
+    try:
+        yield ForkServer(pid, ctl_w, st_r)
+    finally:
+        os.close(ctl_w)
+        os.close(st_r)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        os.waitpid(pid, 0)
+
 __all__ = [
     'SkipTest',
     'assert_equal',
@@ -238,9 +357,13 @@ __all__ = [
     'assert_true',
     'assert_warns_regex',
     'fork_isolation',
+    'fork_server',
+    'python_command',
     'require_commands',
     'run',
+    'shared_map',
     'tempdir',
+    'traced_map',
 ]
 
 # vim:ts=4 sts=4 sw=4 et